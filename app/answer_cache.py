@@ -0,0 +1,121 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+
+from .config import config
+
+
+def normalize_question(question):
+    """Case-fold, collapse whitespace and drop trailing punctuation, so trivial variants share an entry."""
+    return " ".join(question.casefold().split()).rstrip(" ?!.")
+
+
+class AnswerCache:
+    """
+    TTL + LRU cache of Morseverse text answers keyed on (companyId, lang, question).
+
+    Questions matching `exclude_pattern` (ones that refer to the user or to earlier
+    turns of the conversation) always go upstream. Identical questions that arrive
+    while one is already being asked wait for that call instead of sending their own.
+    """
+
+    def __init__(self, enabled=None, max_size=None, ttl=None, exclude_pattern=None):
+        self.enabled = config.ANSWER_CACHE_ENABLED if enabled is None else enabled
+        self.max_size = max_size or config.ANSWER_CACHE_SIZE
+        self.ttl = config.ANSWER_CACHE_TTL if ttl is None else ttl
+        pattern = config.ANSWER_CACHE_EXCLUDE if exclude_pattern is None else exclude_pattern
+        self.exclude = re.compile(pattern, re.IGNORECASE) if pattern else None
+        self._entries = OrderedDict()  # key -> (stored_at, answer)
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+        self._upstream_seconds = 0.0
+
+    def cacheable(self, question):
+        return self.enabled and bool(question) and not (self.exclude and self.exclude.search(question))
+
+    @staticmethod
+    def key(company_id, language, question):
+        return (str(company_id), language or "", normalize_question(question))
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, answer = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def _store(self, key, answer):
+        self._entries[key] = (time.monotonic(), answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_fetch(self, company_id, language, question, fetch):
+        """
+        Return the answer for `question`, calling `fetch()` only on a miss. Only answers
+        without an "error" key and with a non-empty "answer" are stored.
+        """
+        if not self.cacheable(question):
+            self.bypassed += 1
+            return await fetch()
+
+        key = self.key(company_id, language, question)
+        answer = self._lookup(key)
+        if answer is not None:
+            self.hits += 1
+            return answer
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(in_flight)
+
+        self.misses += 1
+        future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        started_at = time.monotonic()
+        try:
+            answer = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Followers re-raise it; don't warn about it going unretrieved when there are none
+            future.exception()
+            raise
+        else:
+            future.set_result(answer)
+            if answer and "error" not in answer and answer.get("answer"):
+                self._store(key, answer)
+        finally:
+            self._upstream_seconds += time.monotonic() - started_at
+            del self._in_flight[key]
+        return answer
+
+    def stats(self):
+        lookups = self.hits + self.coalesced + self.misses
+        mean_upstream = self._upstream_seconds / self.misses if self.misses else 0.0
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            # Morseverse calls avoided, and the time they would have taken at the mean miss latency
+            "upstream_calls_saved": self.hits + self.coalesced,
+            "upstream_seconds_saved": (self.hits + self.coalesced) * mean_upstream,
+        }
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,165 @@
+import asyncio
+import struct
+import time
+
+from .config import config
+from .metrics import timed
+from .scratch import scratch
+
+# Containers whose index may sit at the end of the file, so ffmpeg cannot read them from a pipe
+SEEKABLE_INPUT_TYPES = ("audio/mp4", "audio/x-m4a", "audio/m4a", "audio/aac", "audio/3gpp", "video/mp4", "video/3gpp")
+
+
+class TranscodeError(Exception):
+    """Raised when ffmpeg exits with an error or runs past its timeout."""
+
+
+class TranscodeEngine:
+    """
+    Runs ffmpeg jobs on a fixed number of slots.
+
+    Each job is its own ffmpeg process, so jobs spread across cores; the slot count
+    keeps a burst of voice notes from oversubscribing the CPU and starving text
+    traffic. Jobs beyond the slot count wait in line.
+    """
+
+    def __init__(self, workers=None, timeout=None):
+        self.workers = workers or config.TRANSCODE_WORKERS
+        self.timeout = timeout or config.TRANSCODE_TIMEOUT
+        self._slots = None
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_wait_seconds = 0.0
+
+    @property
+    def slots(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._slots
+
+    async def run(self, data, output_args, input_args=(), seekable_input=False):
+        """
+        Pipe `data` through ffmpeg's stdin/stdout and return the encoded bytes. With
+        `seekable_input` the input goes through a scratch file instead of stdin.
+        """
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        started_at = time.monotonic()
+        self.total_wait_seconds += started_at - queued_at
+        self.active += 1
+        try:
+            if seekable_input:
+                async with scratch.file(data) as path:
+                    output = await self._ffmpeg(None, output_args, input_args, path)
+            else:
+                output = await self._ffmpeg(data, output_args, input_args)
+            self.completed += 1
+            return output
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - started_at
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+            self.active -= 1
+            self.slots.release()
+
+    async def _ffmpeg(self, data, output_args, input_args, input_path='pipe:0'):
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin',
+            *input_args, '-i', input_path, *output_args, 'pipe:1',
+            stdin=asyncio.subprocess.PIPE if data is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(data), self.timeout)
+        except asyncio.TimeoutError:
+            await self._kill(process)
+            self.timed_out += 1
+            raise TranscodeError(f"ffmpeg timed out after {self.timeout}s")
+        except BaseException:
+            # Cancelled: do not leave the encoder running after its slot is handed on
+            await asyncio.shield(self._kill(process))
+            raise
+        if process.returncode != 0:
+            raise TranscodeError(stderr.decode('utf-8', errors='replace').strip())
+        return stdout
+
+    @staticmethod
+    async def _kill(process):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+    def stats(self):
+        jobs = self.completed + self.failed + self.cancelled
+        return {
+            "workers": self.workers,
+            "queue_depth": self.waiting,
+            "active": self.active,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "timed_out": self.timed_out,
+            "avg_job_seconds": self.total_seconds / jobs if jobs else 0.0,
+            "max_job_seconds": self.max_seconds,
+            "avg_wait_seconds": self.total_wait_seconds / jobs if jobs else 0.0,
+        }
+
+
+transcoder = TranscodeEngine()
+
+
+async def transcode(data, output_args, input_args=(), seekable_input=False):
+    """Transcode `data` on the shared engine."""
+    return await transcoder.run(data, output_args, input_args, seekable_input)
+
+
+def fix_wav_header(wav_data):
+    """
+    ffmpeg cannot seek back on a pipe, so it leaves the RIFF and data chunk sizes
+    as placeholders. Patch them now that the whole file is in memory.
+    """
+    wav = bytearray(wav_data)
+    if wav[:4] != b'RIFF' or wav[8:12] != b'WAVE':
+        return bytes(wav)
+    struct.pack_into('<I', wav, 4, len(wav) - 8)
+    offset = 12
+    while offset + 8 <= len(wav):
+        chunk_id = bytes(wav[offset:offset + 4])
+        if chunk_id == b'data':
+            struct.pack_into('<I', wav, offset + 4, len(wav) - offset - 8)
+            break
+        chunk_size = struct.unpack_from('<I', wav, offset + 4)[0]
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return bytes(wav)
+
+
+async def to_wav(data, media_type=None):
+    """Decode any ffmpeg-readable audio (OGG/Opus voice notes, WhatsApp M4A) to PCM WAV."""
+    seekable_input = (media_type or "").split(";")[0].strip().lower() in SEEKABLE_INPUT_TYPES
+    with timed("transcode_to_wav"):
+        return fix_wav_header(await transcode(data, ['-f', 'wav'], seekable_input=seekable_input))
+
+
+async def to_ogg_opus(data):
+    """Encode audio to OGG/Opus, the format Telegram expects for voice messages."""
+    with timed("transcode_to_ogg"):
+        return await transcode(data, ['-c:a', 'libopus', '-f', 'ogg'])
@@ -17,12 +17,143 @@ class Config:
     # Specific API paths
     MORSEVERSE_TEXT_API_PATH: str = "/textusermessage"
     MORSEVERSE_VOICE_API_PATH: str = "/usermessage"
-    MORSEVERSE_VOICE_AI: str = "https://morseverse.com/ai_agent/text_to_audio/"
+    MORSEVERSE_VOICE_AI: str = os.getenv("MORSEVERSE_VOICE_AI", "https://morseverse.com/ai_agent/text_to_audio/")
+
+    # Upstream API roots (overridable so benchmarks can point at local stand-ins)
+    TELEGRAM_API_BASE: str = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+    TWILIO_API_URL: str = os.getenv("TWILIO_API_URL", "https://api.twilio.com/2010-04-01/Accounts")
 
     # Construct full URLs
-    TELEGRAM_API_URL: str = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/"
+    TELEGRAM_API_URL: str = f"{TELEGRAM_API_BASE}/bot{TELEGRAM_BOT_TOKEN}/"
+    TELEGRAM_FILE_URL: str = f"{TELEGRAM_API_BASE}/file/bot{TELEGRAM_BOT_TOKEN}/"
     MORSEVERSE_TEXT_API_URL: str = f"{MORSEVERSE_BASE_URL}{MORSEVERSE_TEXT_API_PATH}"
     MORSEVERSE_VOICE_API_URL: str = f"{MORSEVERSE_BASE_URL}{MORSEVERSE_VOICE_API_PATH}"
 
+    # Voice question upload: "json" (streamed base64) or "multipart";
+    # format "wav" (transcoded PCM) or "ogg" (original Opus, no transcode)
+    MORSEVERSE_VOICE_UPLOAD: str = os.getenv("MORSEVERSE_VOICE_UPLOAD", "json")
+    MORSEVERSE_VOICE_FORMAT: str = os.getenv("MORSEVERSE_VOICE_FORMAT", "wav")
+
+    # Outbound HTTP client (seconds / connection counts)
+    HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "30"))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    HTTP_PER_HOST_LIMIT: int = int(os.getenv("HTTP_PER_HOST_LIMIT", "50"))
+
+    # Telegram ingestion: "webhook" (POST /webhook) or "polling" (long-poll getUpdates)
+    TELEGRAM_INGESTION: str = os.getenv("TELEGRAM_INGESTION", "webhook")
+    TELEGRAM_OFFSET_FILE: str = os.getenv("TELEGRAM_OFFSET_FILE", "telegram_offset.txt")
+    TELEGRAM_POLL_BATCH_SIZE: int = int(os.getenv("TELEGRAM_POLL_BATCH_SIZE", "100"))
+    TELEGRAM_POLL_TIMEOUT: int = int(os.getenv("TELEGRAM_POLL_TIMEOUT", "30"))
+    TELEGRAM_POLL_RETRY_DELAY: float = float(os.getenv("TELEGRAM_POLL_RETRY_DELAY", "5"))
+
+    # Background processing of webhook updates
+    WORKER_COUNT: int = int(os.getenv("WORKER_COUNT", "16"))
+    WORK_QUEUE_SIZE: int = int(os.getenv("WORK_QUEUE_SIZE", "1000"))
+    ENQUEUE_TIMEOUT: float = float(os.getenv("ENQUEUE_TIMEOUT", "0.5"))
+    SHUTDOWN_DRAIN_TIMEOUT: float = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+
+    # ffmpeg transcoding slots (defaults to one per core) and per-job timeout in seconds
+    TRANSCODE_WORKERS: int = int(os.getenv("TRANSCODE_WORKERS", str(os.cpu_count() or 1)))
+    TRANSCODE_TIMEOUT: float = float(os.getenv("TRANSCODE_TIMEOUT", "60"))
+
+    # Cache of encoded TTS replies; TTS_CACHE_DIR enables the on-disk tier
+    TTS_CACHE_MAX_BYTES: int = int(os.getenv("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    TTS_CACHE_DIR: str = os.getenv("TTS_CACHE_DIR", "")
+    TTS_CACHE_TTL: float = float(os.getenv("TTS_CACHE_TTL", str(7 * 24 * 3600)))
+    TTS_FILE_ID_CACHE_SIZE: int = int(os.getenv("TTS_FILE_ID_CACHE_SIZE", "10000"))
+
+    # User preference store: memory, sqlite or redis
+    PREFERENCE_BACKEND: str = os.getenv("PREFERENCE_BACKEND", "sqlite")
+    PREFERENCE_DB_PATH: str = os.getenv("PREFERENCE_DB_PATH", "preferences.db")
+    PREFERENCE_CACHE_TTL: float = float(os.getenv("PREFERENCE_CACHE_TTL", "10"))
+    PREFERENCE_CACHE_SIZE: int = int(os.getenv("PREFERENCE_CACHE_SIZE", "100000"))
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+    # Logging and tracing: LOG_FORMAT is "json" or "text"; TRACE_SPANS logs a line per timed stage
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    TRACE_SPANS: bool = os.getenv("TRACE_SPANS", "false").lower() in ("1", "true", "yes")
+
+    # Platform id -> canonical user id cache
+    IDENTITY_CACHE_SIZE: int = int(os.getenv("IDENTITY_CACHE_SIZE", "100000"))
+    IDENTITY_WARMUP_LIMIT: int = int(os.getenv("IDENTITY_WARMUP_LIMIT", "10000"))
+
+    # Morseverse resilience: whole-call deadline, retries with jittered backoff, optional
+    # hedging (0 disables), and the circuit breaker. Questions carry conversation state,
+    # so after they may have reached Morseverse they are only retried or hedged when
+    # MORSEVERSE_QUESTIONS_IDEMPOTENT is set; TTS calls always are.
+    MORSEVERSE_DEADLINE: float = float(os.getenv("MORSEVERSE_DEADLINE", "20"))
+    MORSEVERSE_RETRIES: int = int(os.getenv("MORSEVERSE_RETRIES", "2"))
+    MORSEVERSE_RETRY_BACKOFF: float = float(os.getenv("MORSEVERSE_RETRY_BACKOFF", "0.2"))
+    MORSEVERSE_HEDGE_AFTER: float = float(os.getenv("MORSEVERSE_HEDGE_AFTER", "0"))
+    MORSEVERSE_QUESTIONS_IDEMPOTENT: bool = os.getenv(
+        "MORSEVERSE_QUESTIONS_IDEMPOTENT", "false").lower() in ("1", "true", "yes")
+    BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+    BREAKER_RESET_TIMEOUT: float = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+    # Opt-in cache of Morseverse text answers; questions matching ANSWER_CACHE_EXCLUDE
+    # (about the user or earlier turns of the conversation) are never cached. The default
+    # only matches possessives and explicit back-references, so "How do I ...?" and
+    # "What is this?" are cached; "my"/"mio" still bypass generic ones like "reset my
+    # password", trading some hit rate for never serving one user's answer to another
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+    ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", "10000"))
+    ANSWER_CACHE_TTL: float = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+    ANSWER_CACHE_EXCLUDE: str = os.getenv(
+        "ANSWER_CACHE_EXCLUDE",
+        r"\b(me|my|mine|myself|our|ours|previous|earlier|you said|you just|last answer|repeat"
+        r"|mio|mia|miei|mie|nostro|nostra|nostri|nostre|precedente|hai detto|ripeti)\b")
+
+    # Outbound rate limits in messages per second (global per channel, and per chat with a
+    # burst allowance), how 429s are retried, and the longest text one message may carry
+    TELEGRAM_RATE_GLOBAL: float = float(os.getenv("TELEGRAM_RATE_GLOBAL", "30"))
+    TELEGRAM_RATE_PER_CHAT: float = float(os.getenv("TELEGRAM_RATE_PER_CHAT", "1"))
+    TELEGRAM_BURST_PER_CHAT: int = int(os.getenv("TELEGRAM_BURST_PER_CHAT", "3"))
+    TWILIO_RATE_GLOBAL: float = float(os.getenv("TWILIO_RATE_GLOBAL", "80"))
+    TWILIO_RATE_PER_CHAT: float = float(os.getenv("TWILIO_RATE_PER_CHAT", "1"))
+    TWILIO_BURST_PER_CHAT: int = int(os.getenv("TWILIO_BURST_PER_CHAT", "3"))
+    OUTBOUND_MAX_DESTINATIONS: int = int(os.getenv("OUTBOUND_MAX_DESTINATIONS", "100000"))
+    OUTBOUND_MAX_RETRIES: int = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+    OUTBOUND_MAX_RETRY_AFTER: float = float(os.getenv("OUTBOUND_MAX_RETRY_AFTER", "60"))
+    OUTBOUND_DEFAULT_RETRY_AFTER: float = float(os.getenv("OUTBOUND_DEFAULT_RETRY_AFTER", "1"))
+    TELEGRAM_MAX_TEXT_LENGTH: int = int(os.getenv("TELEGRAM_MAX_TEXT_LENGTH", "4096"))
+    WHATSAPP_MAX_TEXT_LENGTH: int = int(os.getenv("WHATSAPP_MAX_TEXT_LENGTH", "1600"))
+
+    # Redelivered webhook updates are dropped for DEDUP_WINDOW seconds; "redis" shares
+    # the seen ids between processes (uses REDIS_URL)
+    DEDUP_BACKEND: str = os.getenv("DEDUP_BACKEND", "memory")
+    DEDUP_WINDOW: float = float(os.getenv("DEDUP_WINDOW", "3600"))
+    DEDUP_MAX_ENTRIES: int = int(os.getenv("DEDUP_MAX_ENTRIES", "100000"))
+
+    # Scratch files for ffmpeg inputs that need seeking (tmpfs under /dev/shm by default);
+    # LEGACY_DOWNLOADS_DIR is emptied of the audio files older versions left behind
+    SCRATCH_DIR: str = os.getenv("SCRATCH_DIR", "")
+    SCRATCH_MAX_BYTES: int = int(os.getenv("SCRATCH_MAX_BYTES", str(256 * 1024 * 1024)))
+    SCRATCH_ORPHAN_AGE: float = float(os.getenv("SCRATCH_ORPHAN_AGE", "600"))
+    SCRATCH_SWEEP_INTERVAL: float = float(os.getenv("SCRATCH_SWEEP_INTERVAL", "300"))
+    LEGACY_DOWNLOADS_DIR: str = os.getenv("LEGACY_DOWNLOADS_DIR", "downloads")
+
+    # "together" sends the text and voice answers side by side (text only on Telegram);
+    # "progressive" sends the text answer first on every channel, then the voice answer in
+    # sentence segments of about VOICE_SEGMENT_CHARS, synthesized in parallel
+    REPLY_MODE: str = os.getenv("REPLY_MODE", "together")
+    VOICE_SEGMENT_CHARS: int = int(os.getenv("VOICE_SEGMENT_CHARS", "300"))
+
+    # Traffic recording for offline replay (bench/replay.py): RECORD_PATH enables it. Ids and
+    # numbers are pseudonymized with RECORD_SALT (a random one per process when unset);
+    # RECORD_REDACT_TEXT also masks message text. Audio and other binary bodies are only
+    # stored with RECORD_AUDIO, otherwise just their size is
+    RECORD_PATH: str = os.getenv("RECORD_PATH", "")
+    RECORD_SALT: str = os.getenv("RECORD_SALT", "")
+    RECORD_REDACT_TEXT: bool = os.getenv("RECORD_REDACT_TEXT", "false").lower() in ("1", "true", "yes")
+    RECORD_AUDIO: bool = os.getenv("RECORD_AUDIO", "false").lower() in ("1", "true", "yes")
+    RECORD_MAX_BODY_BYTES: int = int(os.getenv("RECORD_MAX_BODY_BYTES", str(4 * 1024 * 1024)))
+
+    # Web server port and processes (WEB_CONCURRENCY is the name uvicorn and gunicorn already read)
+    PORT: int = int(os.getenv("PORT", "8000"))
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+
 
 config = Config()
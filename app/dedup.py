@@ -0,0 +1,121 @@
+import time
+from collections import OrderedDict
+
+from .config import config
+from .metrics import registry
+
+DEDUP_CHECKS = registry.counter(
+    "bot_dedup_checks_total", "Inbound updates checked for redelivery, by channel and result", ["channel", "result"])
+
+
+class MemoryDedupBackend:
+    """Update ids seen in the last `window` seconds, capped at `max_entries` (oldest dropped first)."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._seen = OrderedDict()  # key -> expires_at, in insertion (and so expiry) order
+
+    def _expire(self, now):
+        # Also makes room for the key about to be added
+        while self._seen:
+            key, expires_at = next(iter(self._seen.items()))
+            if expires_at > now and len(self._seen) < self.max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    async def add(self, key, window):
+        now = time.monotonic()
+        self._expire(now)
+        if key in self._seen:
+            return False
+        self._seen[key] = now + window
+        return True
+
+    async def discard(self, key):
+        self._seen.pop(key, None)
+
+    def size(self):
+        return len(self._seen)
+
+    async def close(self):
+        pass
+
+
+class RedisDedupBackend:
+    """SET NX EX per update id, shared by every worker process. Requires the `redis` package."""
+
+    def __init__(self, url, prefix="dedup:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("DEDUP_BACKEND=redis requires the 'redis' package")
+        self.prefix = prefix
+        self._redis = redis.from_url(url, decode_responses=True)
+
+    async def add(self, key, window):
+        return bool(await self._redis.set(self.prefix + key, "1", nx=True, ex=max(1, int(window))))
+
+    async def discard(self, key):
+        await self._redis.delete(self.prefix + key)
+
+    def size(self):
+        return None  # keys expire server-side
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class UpdateDeduplicator:
+    """
+    Drops redelivered webhook updates (same Telegram update_id or Twilio MessageSid)
+    before they reach the work queue.
+    """
+
+    def __init__(self, backend, window=None):
+        self.backend = backend
+        self.window = config.DEDUP_WINDOW if window is None else window
+        self.accepted = 0
+        self.duplicates = 0
+
+    async def first_seen(self, channel, update_key):
+        """True the first time `update_key` arrives within the window; updates without one always pass."""
+        if update_key is None:
+            return True
+        if await self.backend.add(f"{channel}:{update_key}", self.window):
+            self.accepted += 1
+            DEDUP_CHECKS.inc(channel=channel, result="new")
+            return True
+        self.duplicates += 1
+        DEDUP_CHECKS.inc(channel=channel, result="duplicate")
+        return False
+
+    async def forget(self, channel, update_key):
+        """Let a redelivery through again, e.g. after the update could not be queued."""
+        if update_key is not None:
+            await self.backend.discard(f"{channel}:{update_key}")
+
+    def stats(self):
+        checked = self.accepted + self.duplicates
+        return {
+            "window": self.window,
+            "tracked": self.backend.size(),
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "duplicate_rate": self.duplicates / checked if checked else 0.0,
+        }
+
+    async def close(self):
+        await self.backend.close()
+
+
+def create_deduplicator():
+    """Build the deduplicator selected by DEDUP_BACKEND (memory or redis)."""
+    backend = config.DEDUP_BACKEND.lower()
+    if backend == "memory":
+        return UpdateDeduplicator(MemoryDedupBackend(config.DEDUP_MAX_ENTRIES))
+    if backend == "redis":
+        return UpdateDeduplicator(RedisDedupBackend(config.REDIS_URL))
+    raise ValueError(f"Unknown DEDUP_BACKEND: {config.DEDUP_BACKEND}")
+
+
+deduplicator = create_deduplicator()
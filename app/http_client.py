@@ -0,0 +1,98 @@
+import asyncio
+import base64
+import json
+from urllib.parse import urlsplit
+
+import httpx
+
+from .config import config
+
+
+class HttpClient:
+    """Shared async HTTP client for every outbound call (Telegram, Twilio, Morseverse).
+
+    Connections are kept alive and pooled per host by httpx; on top of that each
+    host gets its own semaphore so a slow upstream cannot take every connection.
+    """
+
+    def __init__(self, timeout=None, connect_timeout=None, max_connections=None,
+                 max_keepalive_connections=None, per_host_limit=None):
+        self.timeout = timeout or config.HTTP_TIMEOUT
+        self.connect_timeout = connect_timeout or config.HTTP_CONNECT_TIMEOUT
+        self.max_connections = max_connections or config.HTTP_MAX_CONNECTIONS
+        self.max_keepalive_connections = max_keepalive_connections or config.HTTP_MAX_KEEPALIVE_CONNECTIONS
+        self.per_host_limit = per_host_limit or config.HTTP_PER_HOST_LIMIT
+        self._client = None
+        self._host_limits = {}
+        # Set before first use: `transport` replaces the network (offline replay) and
+        # `response_hooks` see every response (traffic recording)
+        self.transport = None
+        self.response_hooks = []
+
+    @property
+    def client(self):
+        """Create the underlying client lazily so it binds to the running event loop."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                ),
+                follow_redirects=True,
+                transport=self.transport,
+                event_hooks={"response": list(self.response_hooks)},
+            )
+        return self._client
+
+    def _host_limit(self, url):
+        host = urlsplit(str(url)).netloc
+        semaphore = self._host_limits.get(host)
+        if semaphore is None:
+            semaphore = self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return semaphore
+
+    async def request(self, method, url, **kwargs):
+        async with self._host_limit(url):
+            return await self.client.request(method, url, **kwargs)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+http_client = HttpClient()
+
+
+def base64_json_body(fields, data_field, data, chunk_size=48 * 1024):
+    """
+    Build a streaming JSON body of `fields` plus `data_field` holding `data` in base64.
+
+    The payload is encoded chunk by chunk while it is sent, so the base64 copy and
+    the serialized JSON string never exist in memory as a whole. Returns the
+    (async iterator, headers) pair to pass as `content=` / `headers=`.
+    """
+    chunk_size -= chunk_size % 3  # keep chunks on base64 group boundaries
+    prefix = (json.dumps(fields)[:-1] + f', "{data_field}": "').encode('utf-8')
+    suffix = b'"}'
+    encoded_length = 4 * -(-len(data) // 3)
+    headers = {
+        "Content-Type": "application/json",
+        "Content-Length": str(len(prefix) + encoded_length + len(suffix)),
+    }
+
+    async def body():
+        yield prefix
+        view = memoryview(data)
+        for start in range(0, len(view), chunk_size):
+            yield base64.b64encode(view[start:start + chunk_size])
+        yield suffix
+
+    return body(), headers
@@ -0,0 +1,66 @@
+import hashlib
+from collections import OrderedDict
+
+from .config import config
+
+
+def canonical_user_id(platform_id):
+    """
+    Map a platform id (Telegram user id, 'whatsapp:+...' number) to the Morseverse user id.
+
+    This is the first 24 hex characters of SHA-256(str(platform_id)), i.e. the string
+    form of the ObjectId Morseverse expects, computed without going through bson.
+    """
+    return hashlib.sha256(str(platform_id).encode('utf-8')).hexdigest()[:24]
+
+
+class IdentityResolver:
+    """Bounded LRU in front of canonical_user_id, with hit-rate counters."""
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or config.IDENTITY_CACHE_SIZE
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, platform_id):
+        platform_id = str(platform_id)
+        user_id = self._cache.get(platform_id)
+        if user_id is not None:
+            self._cache.move_to_end(platform_id)
+            self.hits += 1
+            return user_id
+        self.misses += 1
+        user_id = self._cache[platform_id] = canonical_user_id(platform_id)
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return user_id
+
+    def preload(self, platform_ids):
+        """Fill the cache without touching the hit/miss counters."""
+        for platform_id in platform_ids:
+            platform_id = str(platform_id)
+            self._cache[platform_id] = canonical_user_id(platform_id)
+            self._cache.move_to_end(platform_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    async def warm_up(self, preferences, limit=None):
+        """Preload the most recently active users known to the preference store."""
+        limit = config.IDENTITY_WARMUP_LIMIT if limit is None else limit
+        platform_ids = await preferences.platform_ids(limit)
+        self.preload(reversed(platform_ids))
+        return len(platform_ids)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+identity_resolver = IdentityResolver()
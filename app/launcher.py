@@ -0,0 +1,39 @@
+import importlib
+import logging
+import time
+
+from .config import config
+
+# Third-party modules that dominate import time (FastAPI's pydantic models above all).
+# A pre-forking server imports them once in the parent so workers start with them loaded.
+HEAVY_IMPORTS = ("fastapi", "fastapi.routing", "starlette.responses", "starlette.formparsers", "httpx", "sqlite3")
+
+
+def preload_imports(modules=HEAVY_IMPORTS):
+    """Import `modules` without building any app state; returns the seconds it took."""
+    started_at = time.perf_counter()
+    for module in modules:
+        importlib.import_module(module)
+    return time.perf_counter() - started_at
+
+
+def per_worker_state_warnings(workers):
+    """Settings that keep state inside one process and so misbehave with several workers."""
+    if workers <= 1:
+        return []
+    warnings = []
+    if config.PREFERENCE_BACKEND.lower() == "memory":
+        warnings.append("PREFERENCE_BACKEND=memory: each worker keeps its own language settings; "
+                        "use sqlite or redis")
+    if config.DEDUP_BACKEND.lower() == "memory":
+        warnings.append("DEDUP_BACKEND=memory: a redelivery that lands on another worker is processed "
+                        "again; use redis")
+    if config.TELEGRAM_INGESTION == "polling":
+        warnings.append("TELEGRAM_INGESTION=polling: every worker would call getUpdates; "
+                        "run polling with a single worker")
+    return warnings
+
+
+def log_per_worker_state_warnings(workers):
+    for warning in per_worker_state_warnings(workers):
+        logging.warning(f"Running {workers} workers with {warning}")
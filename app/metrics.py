@@ -0,0 +1,210 @@
+import contextvars
+import logging
+import math
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+trace_id = contextvars.ContextVar("trace_id", default=None)
+# time.monotonic() when the current update arrived (before any queueing)
+update_received_at = contextvars.ContextVar("update_received_at", default=None)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f"{self.name}_bucket", key, (("le", _format_value(bound)),), cumulative))
+                samples.append((f"{self.name}_sum", key, (), total))
+                samples.append((f"{self.name}_count", key, (), count))
+        return samples
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+
+class MetricsRegistry:
+    """Holds the metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, prefix, documentation, stats):
+        """Export the numeric fields of `stats()` (a dict) as gauges named `prefix_<field>`."""
+        self._collectors.append((prefix, documentation, stats))
+
+    def render(self):
+        blocks = [metric.render() for metric in self._metrics]
+        for prefix, documentation, stats in self._collectors:
+            for field, value in stats().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{field}"
+                blocks.append(f"# HELP {name} {documentation}: {field}\n# TYPE {name} gauge\n"
+                              f"{name} {_format_value(value)}")
+        return "\n".join(blocks) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "bot_stage_seconds", "Time spent in each stage of message handling", ["stage"])
+STAGE_ERRORS = registry.counter(
+    "bot_stage_errors_total", "Stages that raised an exception", ["stage"])
+IN_FLIGHT = registry.gauge(
+    "bot_in_flight", "Operations currently running per stage", ["stage"])
+UPDATES = registry.counter(
+    "bot_updates_total", "Inbound updates by channel and outcome", ["channel", "status"])
+MORSEVERSE_EMPTY_ANSWERS = registry.counter(
+    "bot_morseverse_empty_answers_total", "Morseverse calls that returned no answer", ["channel"])
+MORSEVERSE_ERRORS = registry.counter(
+    "bot_morseverse_errors_total", "Morseverse calls that returned an error payload", ["kind"])
+QUEUE_WAIT_SECONDS = registry.histogram(
+    "bot_queue_wait_seconds", "Time an update waited in the work queue before a worker picked it up")
+FIRST_RESPONSE_SECONDS = registry.histogram(
+    "bot_first_response_seconds", "Time from receiving a question until the first reply was delivered",
+    ["channel", "kind"])
+
+
+def new_trace(received_at=None):
+    """Start a trace for the current update; spans logged afterwards carry its id."""
+    trace_id.set(uuid.uuid4().hex[:16])
+    update_received_at.set(time.monotonic() if received_at is None else received_at)
+
+
+@contextmanager
+def timed(stage):
+    """
+    Time a block as `stage`: records the duration histogram, the in-flight gauge,
+    an error counter when the block raises and, with TRACE_SPANS on, a span log line.
+    """
+    IN_FLIGHT.inc(stage=stage)
+    started_at = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started_at
+        IN_FLIGHT.dec(stage=stage)
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if config.TRACE_SPANS:
+            logger.info("span", extra={"trace_id": trace_id.get(), "stage": stage,
+                                       "duration_ms": round(elapsed * 1000, 3), "status": status})
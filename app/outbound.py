@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from .config import config
+from .metrics import registry
+
+OUTBOUND_SENDS = registry.counter(
+    "bot_outbound_sends_total", "Outbound platform calls by channel and outcome", ["channel", "status"])
+OUTBOUND_WAIT_SECONDS = registry.histogram(
+    "bot_outbound_wait_seconds", "Time outbound sends waited for a rate-limit token", ["channel"])
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """`rate` tokens per second, up to `burst` saved; `pause()` holds every caller back."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def pause(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def split_text(text, limit):
+    """
+    Split `text` into chunks of at most `limit` characters, preferring line breaks,
+    then spaces, so links and words stay whole.
+    """
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n ")
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+
+def retry_after(response):
+    """Seconds the platform asked us to back off for, from a 429 response."""
+    try:
+        # Telegram: {"ok": false, "error_code": 429, "parameters": {"retry_after": 5}}
+        return float(response.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        pass
+    try:
+        # Twilio and most other HTTP APIs: a Retry-After header in seconds
+        return float(response.headers.get("Retry-After", config.OUTBOUND_DEFAULT_RETRY_AFTER))
+    except ValueError:
+        return config.OUTBOUND_DEFAULT_RETRY_AFTER
+
+
+class OutboundDispatcher:
+    """
+    Rate-limits outbound platform calls with a token bucket per channel and one per
+    destination (chat or phone number), and retries 429 replies after the delay the
+    platform asks for. Sends to the same destination still run concurrently; callers
+    that need ordering (e.g. the chunks of a long reply) await each send in turn.
+    """
+
+    def __init__(self, limits=None, max_destinations=None, max_retries=None, max_retry_after=None):
+        self.limits = limits or {
+            "telegram": (config.TELEGRAM_RATE_GLOBAL, config.TELEGRAM_RATE_PER_CHAT, config.TELEGRAM_BURST_PER_CHAT),
+            "whatsapp": (config.TWILIO_RATE_GLOBAL, config.TWILIO_RATE_PER_CHAT, config.TWILIO_BURST_PER_CHAT),
+        }
+        self.max_destinations = max_destinations or config.OUTBOUND_MAX_DESTINATIONS
+        self.max_retries = config.OUTBOUND_MAX_RETRIES if max_retries is None else max_retries
+        self.max_retry_after = max_retry_after or config.OUTBOUND_MAX_RETRY_AFTER
+        self._global = {channel: TokenBucket(rate, rate) for channel, (rate, _, _) in self.limits.items()}
+        self._destinations = OrderedDict()
+        self.waiting = 0
+        self.throttled = 0
+        self.dropped = 0
+
+    def _destination_bucket(self, channel, destination):
+        key = (channel, str(destination))
+        bucket = self._destinations.get(key)
+        if bucket is None:
+            _, rate, burst = self.limits[channel]
+            bucket = self._destinations[key] = TokenBucket(rate, burst)
+            if len(self._destinations) > self.max_destinations:
+                self._destinations.popitem(last=False)
+        else:
+            self._destinations.move_to_end(key)
+        return bucket
+
+    async def send(self, channel, destination, send):
+        """
+        Call `send()` (returning an httpx.Response) once both buckets allow it. A 429 is
+        retried after its retry_after, at most `max_retries` times; the last response
+        is returned either way.
+        """
+        destination_bucket = self._destination_bucket(channel, destination)
+        attempt = 0
+        while True:
+            started_at = time.monotonic()
+            self.waiting += 1
+            try:
+                await destination_bucket.acquire()
+                await self._global[channel].acquire()
+            finally:
+                self.waiting -= 1
+            OUTBOUND_WAIT_SECONDS.observe(time.monotonic() - started_at, channel=channel)
+
+            response = await send()
+            if response.status_code != 429:
+                OUTBOUND_SENDS.inc(channel=channel, status="sent" if response.is_success else "failed")
+                return response
+
+            delay = retry_after(response)
+            if attempt >= self.max_retries or delay > self.max_retry_after:
+                self.dropped += 1
+                OUTBOUND_SENDS.inc(channel=channel, status="dropped")
+                logger.warning(f"Dropping {channel} message to {destination}: rate limited for {delay}s")
+                return response
+            attempt += 1
+            self.throttled += 1
+            OUTBOUND_SENDS.inc(channel=channel, status="throttled")
+            destination_bucket.pause(delay)
+
+    def stats(self):
+        return {
+            "destinations": len(self._destinations),
+            "waiting": self.waiting,
+            "throttled": self.throttled,
+            "dropped": self.dropped,
+        }
+
+
+dispatcher = OutboundDispatcher()
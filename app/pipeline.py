@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from .config import config
+from .identity import identity_resolver
+from .metrics import FIRST_RESPONSE_SECONDS, MORSEVERSE_EMPTY_ANSWERS, timed, update_received_at
+from .tts_cache import tts_cache
+
+SERVER_ERROR_MESSAGE = "Server Error, please try again."
+NO_CONTENT_MESSAGE = "Sorry, I didn't receive any message content."
+UNAVAILABLE_MESSAGE = "The assistant is temporarily unavailable, please try again in a few minutes."
+
+
+@dataclass
+class InboundMessage:
+    """A channel-independent view of one inbound update."""
+
+    channel: str              # "telegram" or "whatsapp"
+    destination: object       # where replies go: Telegram chat id, WhatsApp 'whatsapp:+...' number
+    platform_user_id: object  # sender id on the platform, mapped to the Morseverse user id
+    kind: str                 # start, text, voice, set_language, media, empty
+    text: Optional[str] = None
+    voice_ref: Optional[str] = None  # Telegram file_id or Twilio media URL
+    media_type: Optional[str] = None
+    language_code: Optional[str] = None
+    received_at: Optional[float] = None  # time.monotonic() when the update arrived
+    responded: bool = False              # set once the first reply has been delivered
+
+
+def normalize_telegram(data):
+    """Turn a Telegram update into an InboundMessage, or None if there is nothing to do."""
+    if "message" in data:
+        message = data["message"]
+        inbound = InboundMessage("telegram", message["chat"]["id"], message["from"]["id"], "text")
+        if message.get("text", "").lower() in ["start", "/start"]:
+            inbound.kind = "start"
+        elif "text" in message:
+            inbound.kind, inbound.text = "text", message["text"]
+        elif "voice" in message:
+            inbound.kind, inbound.voice_ref = "voice", message["voice"]["file_id"]
+        else:
+            return None
+        return inbound
+
+    if "callback_query" in data:
+        callback = data["callback_query"]
+        if not callback["data"].startswith("set_lang_"):
+            return None
+        return InboundMessage("telegram", callback["message"]["chat"]["id"], callback["from"]["id"],
+                              "set_language", language_code=callback["data"].split("_")[-1])
+    return None
+
+
+def normalize_whatsapp(data):
+    """Turn a Twilio WhatsApp webhook form into an InboundMessage."""
+    from_number = data.get("From")  # e.g., 'whatsapp:+1234567890'
+    message_body = data.get("Body")
+    num_media = int(data.get("NumMedia", "0"))
+    inbound = InboundMessage("whatsapp", from_number, from_number, "empty")
+    if message_body and num_media == 0:
+        inbound.kind, inbound.text = "text", message_body
+    elif num_media > 0:
+        inbound.media_type = data.get("MediaContentType0") or ""
+        if 'audio' in inbound.media_type:
+            inbound.kind, inbound.voice_ref = "voice", data.get("MediaUrl0")
+        else:
+            inbound.kind = "media"
+    return inbound
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def split_sentences(text, max_chars):
+    """
+    Split `text` into segments of whole sentences, each up to `max_chars` long where
+    possible, so long answers can be synthesized in parallel and spoken in order.
+    """
+    segments = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        if segments and len(segments[-1]) + 1 + len(sentence) <= max_chars:
+            segments[-1] += " " + sentence
+        else:
+            segments.append(sentence)
+    return segments or [text]
+
+
+def render_answer(morseverse_response, default):
+    """The text reply for a Morseverse answer: the answer followed by its links."""
+    response_message = morseverse_response.get("answer", default)
+    links = morseverse_response.get("links", [])
+    if links:
+        response_message += '\n' + '\n'.join(links)
+    return response_message
+
+
+class MessagePipeline:
+    """
+    normalize -> resolve user -> ask Morseverse -> render reply -> deliver.
+
+    Channel specifics live in the adapters (TelegramService, WhatsAppService), which
+    only download media and send messages; everything else is shared.
+    """
+
+    def __init__(self, morseverse, adapters):
+        self.morseverse = morseverse
+        self.adapters = {adapter.channel: adapter for adapter in adapters}
+
+    async def handle(self, inbound):
+        if inbound.received_at is None:
+            inbound.received_at = update_received_at.get() or time.monotonic()
+        with timed(f"handle_{inbound.channel}"):
+            try:
+                return await self._handle(inbound)
+            except Exception as e:
+                logging.error(f"Error handling {inbound.channel} message: {e}")
+                return {"status": "error", "message": str(e)}
+
+    async def _handle(self, inbound):
+        adapter = self.adapters[inbound.channel]
+        user_id = identity_resolver.resolve(inbound.platform_user_id)
+
+        if inbound.kind == "start":
+            # Present language options to the user
+            await adapter.send_language_options(inbound.destination)
+
+        elif inbound.kind == "set_language":
+            # Same canonical key as the message path, so the preference is found later
+            await self.morseverse.set_user_language(user_id, inbound.language_code, inbound.platform_user_id)
+            await adapter.send_message(inbound.destination, f"Language set to {inbound.language_code}.")
+
+        elif inbound.kind == "text":
+            logging.info(f"Received {inbound.channel} text message from {inbound.destination}")
+            language = await self.morseverse.get_user_language(user_id)
+            morseverse_response = await self.morseverse.send_text_to_morseverse(user_id, inbound.text, language)
+            if not self._has_answer(inbound, morseverse_response):
+                await adapter.send_message(inbound.destination, SERVER_ERROR_MESSAGE)
+                return {"status": "Error (null server answer)"}
+            if "error" in morseverse_response:
+                return await self._send_fallback(adapter, inbound, morseverse_response)
+            reply = render_answer(morseverse_response, "Server error, please try later.")
+            await self._send_text(adapter, inbound, reply)
+
+        elif inbound.kind == "voice":
+            logging.info(f"Received {inbound.channel} voice message from {inbound.destination}")
+            language = await self.morseverse.get_user_language(user_id)
+            ogg_data = await adapter.download_voice_file(inbound.voice_ref)
+            # Convert the OGG audio to WAV in memory, unless Morseverse takes Opus directly
+            if config.MORSEVERSE_VOICE_FORMAT == "ogg":
+                audio_data = ogg_data
+            else:
+                audio_data = await self.morseverse.convert_to_wav(ogg_data, inbound.media_type)
+            morseverse_response = await self.morseverse.send_voice_to_morseverse(
+                user_id, audio_data, language, config.MORSEVERSE_VOICE_FORMAT)
+            if not self._has_answer(inbound, morseverse_response):
+                await adapter.send_message(inbound.destination, SERVER_ERROR_MESSAGE)
+                return {"status": "Error (null server answer)"}
+            if "error" in morseverse_response:
+                return await self._send_fallback(adapter, inbound, morseverse_response)
+            reply = render_answer(morseverse_response, "Please try again.")
+            if config.REPLY_MODE == "progressive" or adapter.sends_text_with_voice:
+                # The text answer goes out first; the voice is synthesized meanwhile and follows it
+                text_sent = asyncio.create_task(self._send_text(adapter, inbound, reply))
+                await self.send_voice_answer(adapter, inbound.destination, morseverse_response, language,
+                                             on_delivered=lambda: self._delivered(inbound), after=text_sent)
+            elif not await self.send_voice_answer(adapter, inbound.destination, morseverse_response, language,
+                                                  on_delivered=lambda: self._delivered(inbound)):
+                # No voice got through (e.g. Twilio refused the audio): answer in text instead
+                await self._send_text(adapter, inbound, reply)
+
+        elif inbound.kind == "media":
+            # Handle other media types if needed
+            await adapter.send_message(inbound.destination, f"Received your {inbound.media_type} file.")
+
+        elif inbound.kind == "empty":
+            await adapter.send_message(inbound.destination, NO_CONTENT_MESSAGE)
+
+        return {"status": "success"}
+
+    @staticmethod
+    def _has_answer(inbound, morseverse_response):
+        """Count Morseverse replies that carry no answer; True when there is one to send."""
+        if morseverse_response is None or not morseverse_response.get("answer"):
+            MORSEVERSE_EMPTY_ANSWERS.inc(channel=inbound.channel)
+        return morseverse_response is not None
+
+    @staticmethod
+    def _delivered(inbound):
+        """Record time-to-first-response the first time anything answering `inbound` is delivered."""
+        if not inbound.responded:
+            inbound.responded = True
+            FIRST_RESPONSE_SECONDS.observe(time.monotonic() - inbound.received_at,
+                                           channel=inbound.channel, kind=inbound.kind)
+
+    async def _send_text(self, adapter, inbound, text):
+        await adapter.send_message(inbound.destination, text)
+        self._delivered(inbound)
+
+    @staticmethod
+    async def _send_fallback(adapter, inbound, morseverse_response):
+        """Tell the user Morseverse could not answer, without synthesizing any audio."""
+        if morseverse_response.get("unavailable"):
+            await adapter.send_message(inbound.destination, UNAVAILABLE_MESSAGE)
+        else:
+            await adapter.send_message(inbound.destination, SERVER_ERROR_MESSAGE)
+        return {"status": "error", "message": morseverse_response["error"]}
+
+    async def send_voice_answer(self, adapter, destination, morseverse_response, language=None,
+                                on_delivered=None, after=None):
+        """
+        Speak `voice_answer` to the user, reusing cached audio and uploaded file_ids.
+
+        In the progressive reply mode a long answer is split into sentence segments that
+        are synthesized in parallel and sent in order, each as soon as it and every
+        segment before it are ready. Synthesis starts at once, but nothing is sent until
+        `after` (e.g. the text reply being sent) has completed. Returns the number of
+        segments delivered.
+        """
+        voice_answer_text = morseverse_response.get("voice_answer", "Please try again.")
+        if config.REPLY_MODE == "progressive":
+            segments = split_sentences(voice_answer_text, config.VOICE_SEGMENT_CHARS)
+        else:
+            segments = [voice_answer_text]
+
+        prepared = [asyncio.create_task(self._prepare_voice(adapter, segment, language)) for segment in segments]
+        delivered = 0
+        try:
+            if after is not None:
+                await after
+            for segment, task in zip(segments, prepared):
+                cache_key, voice = await task
+                if await self._deliver_voice(adapter, destination, segment, cache_key, voice):
+                    delivered += 1
+                    if on_delivered:
+                        on_delivered()
+        finally:
+            for task in prepared:
+                task.cancel()
+        return delivered
+
+    async def _prepare_voice(self, adapter, text, language):
+        """(cache key, file_id of an earlier upload or freshly synthesized OGG bytes or None)."""
+        cache_key = tts_cache.key(text, language)
+        # Reuse a previous upload of the same audio when the platform still has it
+        if adapter.reuses_file_ids:
+            file_id = tts_cache.get_file_id(cache_key)
+            if file_id is not None:
+                return cache_key, file_id
+        return cache_key, await self.morseverse.synthesize_voice(text, cache_key)
+
+    async def _deliver_voice(self, adapter, destination, text, cache_key, voice):
+        """Send one voice segment; returns True when it was delivered."""
+        if isinstance(voice, str):
+            result = await adapter.send_voice(destination, voice)
+            if adapter.voice_delivered(result):
+                return True
+            tts_cache.forget_file_id(cache_key)
+            voice = await self.morseverse.synthesize_voice(text, cache_key)
+
+        if voice is None:
+            return False
+        result = await adapter.send_voice(destination, voice)
+        if not adapter.voice_delivered(result):
+            logging.warning(f"{adapter.channel} refused a voice reply: {result}")
+            return False
+        file_id = adapter.voice_file_id(result)
+        if file_id:
+            tts_cache.set_file_id(cache_key, file_id)
+        return True
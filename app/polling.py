@@ -0,0 +1,101 @@
+import asyncio
+import json
+import logging
+import os
+
+from .config import config
+from .http_client import http_client
+
+
+class TelegramPoller:
+    """
+    Pulls updates from Telegram with long-polling `getUpdates` instead of the webhook.
+
+    Each batch is pushed onto the work queue, so updates are processed concurrently
+    with the same per-chat ordering as webhook traffic; a full lane holds the poller
+    back rather than dropping updates. The next offset is written to `offset_file`
+    after every batch so a restart resumes where it left off.
+    """
+
+    def __init__(self, work_queue, handler, chat_id_of, offset_file=None,
+                 batch_size=None, poll_timeout=None):
+        self.work_queue = work_queue
+        self.handler = handler
+        self.chat_id_of = chat_id_of
+        self.offset_file = offset_file or config.TELEGRAM_OFFSET_FILE
+        self.batch_size = batch_size or config.TELEGRAM_POLL_BATCH_SIZE
+        self.poll_timeout = poll_timeout or config.TELEGRAM_POLL_TIMEOUT
+        self.offset = self._load_offset()
+        self._stopping = False
+
+    def _load_offset(self):
+        try:
+            with open(self.offset_file) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _save_offset(self):
+        tmp_path = f"{self.offset_file}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(self.offset))
+        os.replace(tmp_path, self.offset_file)
+
+    async def get_updates(self):
+        params = {
+            "offset": self.offset,
+            "limit": self.batch_size,
+            "timeout": self.poll_timeout,
+            "allowed_updates": json.dumps(["message", "callback_query"]),
+        }
+        # Give the HTTP read a little longer than Telegram holds the poll open
+        response = await http_client.get(
+            config.TELEGRAM_API_URL + "getUpdates", params=params, timeout=self.poll_timeout + 10)
+        body = response.json()
+        if not body.get("ok"):
+            raise RuntimeError(f"getUpdates failed: {body.get('description')}")
+        return body["result"]
+
+    async def dispatch(self, updates):
+        """
+        Queue `updates` in order, waiting for room when a lane is full, and move the
+        offset past each one as it is queued.
+        """
+        start_offset = self.offset
+        try:
+            for update in updates:
+                if "message" in update or "callback_query" in update:
+                    try:
+                        chat_id = self.chat_id_of(update)
+                    except (KeyError, TypeError):
+                        logging.warning(f"Skipping update {update.get('update_id')} without a chat")
+                    else:
+                        await self.work_queue.submit(chat_id, self.handler, update, block=True)
+                self.offset = update["update_id"] + 1
+        finally:
+            if self.offset != start_offset:
+                await asyncio.to_thread(self._save_offset)
+
+    async def delete_webhook(self):
+        # getUpdates is refused while a webhook is registered
+        response = await http_client.post(config.TELEGRAM_API_URL + "deleteWebhook")
+        body = response.json()
+        if not body.get("ok"):
+            raise RuntimeError(f"deleteWebhook failed: {body.get('description')}")
+
+    async def run(self):
+        webhook_deleted = False
+        while not self._stopping:
+            try:
+                if not webhook_deleted:
+                    await self.delete_webhook()
+                    webhook_deleted = True
+                    logging.info(f"Polling Telegram for updates from offset {self.offset}")
+                await self.dispatch(await self.get_updates())
+            except Exception as e:
+                # Anything short of cancellation must not end the poller
+                logging.error(f"Error polling Telegram: {e!r}")
+                await asyncio.sleep(config.TELEGRAM_POLL_RETRY_DELAY)
+
+    def stop(self):
+        self._stopping = True
@@ -0,0 +1,192 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .config import config
+
+DEFAULT_LANGUAGE = "EN-US"
+
+
+class MemoryPreferenceBackend:
+    """Per-process dict. Fine for a single worker; lost on restart."""
+
+    def __init__(self):
+        self._values = {}
+
+    async def get(self, user_key, name):
+        return self._values.get((user_key, name))
+
+    async def set(self, user_key, name, value):
+        self._values.pop((user_key, name), None)
+        self._values[(user_key, name)] = value
+
+    async def recent_values(self, name, limit):
+        values = [value for (_, key_name), value in reversed(self._values.items()) if key_name == name]
+        return values[:limit]
+
+    async def close(self):
+        pass
+
+
+class SQLitePreferenceBackend:
+    """Embedded SQLite file, shared by every worker on the host (WAL mode)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS preferences ("
+                " user_key TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (user_key, name))"
+            )
+
+    def _get(self, user_key, name):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM preferences WHERE user_key = ? AND name = ?", (user_key, name)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, user_key, name, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO preferences (user_key, name, value, updated_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (user_key, name) DO UPDATE SET value = excluded.value,"
+                " updated_at = excluded.updated_at",
+                (user_key, name, value, time.time()),
+            )
+
+    def _recent_values(self, name, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT value FROM preferences WHERE name = ? ORDER BY updated_at DESC LIMIT ?", (name, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    async def get(self, user_key, name):
+        return await asyncio.to_thread(self._get, user_key, name)
+
+    async def set(self, user_key, name, value):
+        await asyncio.to_thread(self._set, user_key, name, value)
+
+    async def recent_values(self, name, limit):
+        return await asyncio.to_thread(self._recent_values, name, limit)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisPreferenceBackend:
+    """Redis (or any Redis-compatible server) hash per user. Requires the `redis` package."""
+
+    def __init__(self, url, prefix="prefs:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("PREFERENCE_BACKEND=redis requires the 'redis' package")
+        self.prefix = prefix
+        self._redis = redis.from_url(url, decode_responses=True)
+
+    async def get(self, user_key, name):
+        return await self._redis.hget(self.prefix + user_key, name)
+
+    async def set(self, user_key, name, value):
+        await self._redis.hset(self.prefix + user_key, name, value)
+
+    async def recent_values(self, name, limit):
+        # Redis has no cheap recency order here; return up to `limit` values
+        values = []
+        async for key in self._redis.scan_iter(match=self.prefix + "*", count=500):
+            value = await self._redis.hget(key, name)
+            if value is not None:
+                values.append(value)
+                if len(values) >= limit:
+                    break
+        return values
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class PreferenceStore:
+    """
+    User preferences keyed by the canonical user id, with a read-through cache.
+
+    Cached values expire after `cache_ttl` seconds so a change made by another
+    worker is picked up shortly after; writes go straight to the backend. The cache
+    is an LRU holding at most `cache_size` entries.
+    """
+
+    def __init__(self, backend, cache_ttl=None, cache_size=None):
+        self.backend = backend
+        self.cache_ttl = config.PREFERENCE_CACHE_TTL if cache_ttl is None else cache_ttl
+        self.cache_size = config.PREFERENCE_CACHE_SIZE if cache_size is None else cache_size
+        self._cache = OrderedDict()
+
+    def _lookup(self, key):
+        cached = self._cache.get(key)
+        if cached is None:
+            return False, None
+        if cached[1] <= time.monotonic():
+            del self._cache[key]
+            return False, None
+        self._cache.move_to_end(key)
+        return True, cached[0]
+
+    def _remember(self, key, value):
+        self._cache[key] = (value, time.monotonic() + self.cache_ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def get(self, user_key, name, default=None):
+        found, value = self._lookup((user_key, name))
+        if not found:
+            value = await self.backend.get(user_key, name)
+            self._remember((user_key, name), value)
+        return default if value is None else value
+
+    async def set(self, user_key, name, value):
+        await self.backend.set(user_key, name, value)
+        self._remember((user_key, name), value)
+
+    async def get_language(self, user_key):
+        return await self.get(user_key, "language", DEFAULT_LANGUAGE)
+
+    async def set_language(self, user_key, language_code, platform_id=None):
+        await self.set(user_key, "language", language_code)
+        if platform_id is not None:
+            # Kept so the identity cache can be warmed up from known users
+            await self.set(user_key, "platform_id", str(platform_id))
+
+    async def platform_ids(self, limit):
+        """Platform ids of the most recently updated users, newest first."""
+        return await self.backend.recent_values("platform_id", limit)
+
+    async def close(self):
+        await self.backend.close()
+
+
+def create_preference_store():
+    """Build the store selected by PREFERENCE_BACKEND (memory, sqlite or redis)."""
+    backend = config.PREFERENCE_BACKEND.lower()
+    if backend == "sqlite":
+        return PreferenceStore(SQLitePreferenceBackend(config.PREFERENCE_DB_PATH))
+    if backend == "redis":
+        return PreferenceStore(RedisPreferenceBackend(config.REDIS_URL))
+    if backend == "memory":
+        return PreferenceStore(MemoryPreferenceBackend())
+    raise ValueError(f"Unknown PREFERENCE_BACKEND: {config.PREFERENCE_BACKEND}")
+
+
+preference_store = create_preference_store()
@@ -0,0 +1,141 @@
+import atexit
+import base64
+import hashlib
+import json
+import logging
+import queue
+import re
+import secrets
+import threading
+import time
+
+from .config import config
+
+# Fields that identify a person rather than shape the traffic
+PERSONAL_FIELDS = {"first_name", "last_name", "username", "phone_number", "ProfileName", "WaId", "AccountSid",
+                   "account_sid"}
+# Objects whose "id" is a Telegram user or chat id
+PERSON_OBJECTS = {"from", "chat", "user"}
+# Twilio form fields holding the sender/recipient number
+NUMBER_FIELDS = {"From", "To", "from", "to"}
+# Message text in webhooks and Twilio replies, and Morseverse's answers to it
+TEXT_FIELDS = {"text", "Body", "body", "answer", "voice_answer"}
+
+_BOT_TOKEN = re.compile(r"/bot[^/]*/")
+_ACCOUNT_SID = re.compile(r"/Accounts/[^/]*/")
+_NUMBER = re.compile(r"\+\d+")
+
+# Random when RECORD_SALT is unset, so pseudonyms cannot be reversed by hashing candidate
+# ids; never written to the recording
+_SALT = config.RECORD_SALT or secrets.token_hex(16)
+
+
+def sanitize_url(url):
+    """Drop the bot token and Twilio account sid from an API URL; replay matches on this form."""
+    return _ACCOUNT_SID.sub("/Accounts/<sid>/", _BOT_TOKEN.sub("/bot<token>/", str(url)))
+
+
+def pseudonym(value):
+    """A stable stand-in for a user id or phone number: same input, same digits."""
+    return int(hashlib.sha256(f"{_SALT}:{value}".encode("utf-8")).hexdigest()[:12], 16)
+
+
+def sanitize(value, key=None, parent=None):
+    """
+    Copy of a webhook payload or API response with names, numbers and tokens replaced.
+    Ids are pseudonymized consistently, so chats keep their ordering and dedup keys on replay.
+    """
+    if isinstance(value, dict):
+        return {k: sanitize(v, k, key) for k, v in value.items() if k not in PERSONAL_FIELDS}
+    if isinstance(value, list):
+        return [sanitize(v, key, parent) for v in value]
+    if key == "id" and parent in PERSON_OBJECTS and isinstance(value, int):
+        return pseudonym(value)
+    if key in ("chat_id", "user_id") and isinstance(value, int):
+        return pseudonym(value)
+    if key in NUMBER_FIELDS and isinstance(value, str):
+        return _NUMBER.sub(lambda m: f"+{pseudonym(m.group(0))}", value)
+    if key in TEXT_FIELDS and isinstance(value, str) and config.RECORD_REDACT_TEXT:
+        return re.sub(r"\S", "x", value)
+    if isinstance(value, str) and (value.startswith("http") or "/Accounts/" in value):
+        # Twilio's "uri" and "subresource_uris" are paths carrying the account sid
+        return sanitize_url(value)
+    return value
+
+
+def _body(response):
+    content = response.content
+    if len(content) > config.RECORD_MAX_BODY_BYTES:
+        return {"truncated": len(content)}
+    content_type = response.headers.get("content-type", "")
+    if "json" in content_type:
+        try:
+            return {"json": sanitize(response.json())}
+        except ValueError:
+            pass
+    if content_type.startswith("text/"):
+        return {"text": response.text}
+    if not config.RECORD_AUDIO:
+        # Voice notes and synthesized speech: keep the size, replay substitutes a stock clip
+        return {"placeholder": len(content)}
+    return {"base64": base64.b64encode(content).decode("ascii")}
+
+
+class TrafficRecorder:
+    """
+    Appends sanitized inbound webhook payloads and upstream responses to a JSONL file,
+    one event per line, written by a background thread off the event loop.
+
+        {"t": 0.0, "type": "inbound", "channel": "telegram", "data": {...}}
+        {"t": 0.2, "type": "upstream", "method": "POST", "url": "...", "status": 200,
+         "elapsed": 0.18, "content_type": "application/json", "json": {...}}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.events = 0
+        self._started_at = time.monotonic()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write, name="traffic-recorder", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _emit(self, event):
+        event = {"t": round(time.monotonic() - self._started_at, 6), **event}
+        self._queue.put(json.dumps(event, separators=(",", ":")))
+        self.events += 1
+
+    def _write(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                line = self._queue.get()
+                if line is None:
+                    return
+                f.write(line + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def record_inbound(self, channel, data):
+        self._emit({"type": "inbound", "channel": channel, "data": sanitize(data)})
+
+    async def record_response(self, response):
+        """httpx response event hook: record every upstream reply."""
+        await response.aread()
+        self._emit({
+            "type": "upstream",
+            "method": response.request.method,
+            "url": sanitize_url(response.request.url),
+            "status": response.status_code,
+            "elapsed": round(response.elapsed.total_seconds(), 6),
+            "content_type": response.headers.get("content-type", ""),
+            **_body(response),
+        })
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+            logging.info(f"Recorded {self.events} events to {self.path}")
+
+
+recorder = TrafficRecorder(config.RECORD_PATH) if config.RECORD_PATH else None
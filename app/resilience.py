@@ -0,0 +1,181 @@
+import asyncio
+import random
+import time
+
+import httpx
+
+from .config import config
+from .metrics import registry
+
+BREAKER_STATE = registry.gauge(
+    "bot_circuit_breaker_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["name"])
+BREAKER_REJECTIONS = registry.counter(
+    "bot_circuit_breaker_rejections_total", "Calls failed fast because the breaker was open", ["name"])
+RETRIES = registry.counter(
+    "bot_upstream_retries_total", "Retried upstream calls", ["name"])
+HEDGES = registry.counter(
+    "bot_upstream_hedged_total", "Hedged requests sent, and how many of them won", ["name", "outcome"])
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for
+    `reset_timeout` seconds, then lets one trial call through (half-open).
+    """
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or config.BREAKER_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or config.BREAKER_RESET_TIMEOUT
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._set_state(CLOSED)
+
+    def _set_state(self, state):
+        self.state = state
+        BREAKER_STATE.set(_STATE_VALUES[state], name=self.name)
+
+    def before_call(self):
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                BREAKER_REJECTIONS.inc(name=self.name)
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._trial_in_flight:
+                BREAKER_REJECTIONS.inc(name=self.name)
+                raise CircuitOpenError(f"{self.name} circuit is half-open")
+            self._trial_in_flight = True
+
+    def record_success(self):
+        self._trial_in_flight = False
+        self.failures = 0
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def release(self):
+        """Forget a trial call that ended without a verdict on the upstream."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._trial_in_flight = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+
+class UpstreamFailure(Exception):
+    """An upstream answered with a status that should count against the breaker."""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP error {response.status_code}")
+        self.response = response
+
+
+def _retryable(error, idempotent):
+    # A request that never reached the server is always safe to resend; anything
+    # that may have been processed (read timeout, 5xx) only for idempotent calls.
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    if not idempotent:
+        return False
+    if isinstance(error, UpstreamFailure):
+        return error.response.status_code in (429, 502, 503, 504)
+    return isinstance(error, httpx.TransportError)
+
+
+class ResilientClient:
+    """
+    Wraps calls to one upstream with a per-call deadline, jittered exponential
+    retries, a circuit breaker and optional request hedging.
+
+    `send` is an async callable returning an httpx.Response; it is called again for
+    every attempt, so it must build a fresh request body each time. 5xx and 429
+    responses count as failures and raise UpstreamFailure once retries run out;
+    other responses are returned to the caller untouched.
+    """
+
+    def __init__(self, name, deadline=None, retries=None, backoff=None, hedge_after=None):
+        self.name = name
+        self.deadline = deadline or config.MORSEVERSE_DEADLINE
+        self.retries = config.MORSEVERSE_RETRIES if retries is None else retries
+        self.backoff = backoff or config.MORSEVERSE_RETRY_BACKOFF
+        self.hedge_after = config.MORSEVERSE_HEDGE_AFTER if hedge_after is None else hedge_after
+        self.breaker = CircuitBreaker(name)
+
+    async def _attempt(self, send):
+        response = await send()
+        if response.status_code >= 500 or response.status_code == 429:
+            raise UpstreamFailure(response)
+        return response
+
+    async def _hedged(self, send):
+        """Start a second identical request if the first is still running after `hedge_after`."""
+        tasks = [asyncio.ensure_future(self._attempt(send))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done:
+                HEDGES.inc(name=self.name, outcome="sent")
+                tasks.append(asyncio.ensure_future(self._attempt(send)))
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            HEDGES.inc(name=self.name, outcome="won")
+                        return task.result()
+                if not pending:
+                    raise done.pop().exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, send, idempotent=False, hedge=False):
+        """
+        Run `send` under the deadline. Only idempotent calls are hedged, or retried
+        after the request may have reached the server.
+        """
+        self.breaker.before_call()
+        try:
+            response = await self._call_with_retries(send, idempotent, hedge and idempotent and self.hedge_after)
+        except (httpx.HTTPError, UpstreamFailure):
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled or failed for a reason that says nothing about the upstream;
+            # a half-open trial must still not stay in flight forever
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return response
+
+    async def _call_with_retries(self, send, idempotent, hedge):
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            remaining = self.deadline - (time.monotonic() - started_at)
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                return await asyncio.wait_for(self._hedged(send) if hedge else self._attempt(send), remaining)
+            except asyncio.TimeoutError:
+                error = httpx.TimeoutException(f"{self.name} deadline of {self.deadline}s exceeded")
+            except (httpx.HTTPError, UpstreamFailure) as e:
+                error = e
+            delay = random.uniform(0, self.backoff * 2 ** attempt)
+            if (attempt >= self.retries or not _retryable(error, idempotent)
+                    or time.monotonic() - started_at + delay >= self.deadline):
+                raise error
+            attempt += 1
+            RETRIES.inc(name=self.name)
+            await asyncio.sleep(delay)
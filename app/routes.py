@@ -1,180 +1,157 @@
 # app.py
 
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 
-from bson import ObjectId
 from fastapi import FastAPI, Request
-from starlette.responses import JSONResponse
-from .services import TelegramService
-from .services import WhatsAppService
-import hashlib
-
-
-app = FastAPI()
+from starlette.responses import JSONResponse, PlainTextResponse
+from .services import MorseverseService, TelegramService, WhatsAppService
+from .pipeline import MessagePipeline, normalize_telegram, normalize_whatsapp
+from .http_client import http_client
+from .workers import QueueFullError, work_queue
+from .audio import transcoder
+from .tts_cache import tts_cache
+from .preferences import preference_store
+from .identity import identity_resolver
+from .answer_cache import answer_cache
+from .outbound import dispatcher
+from .dedup import deduplicator
+from .scratch import remove_legacy_downloads, scratch
+from .recording import recorder
+from .polling import TelegramPoller
+from .config import config
+from .logs import configure_logging
+from .metrics import UPDATES, registry, timed
+
+
+async def startup():
+    """Bring up shared resources. Used by the web app and the offline replay mode."""
+    # Drop TTS cache files that expired while the app was down
+    await asyncio.to_thread(tts_cache.sweep_disk)
+    removed = await asyncio.to_thread(remove_legacy_downloads)
+    if removed:
+        logging.info(f"Removed {removed} leftover audio files from {config.LEGACY_DOWNLOADS_DIR}")
+    await scratch.start()
+    await identity_resolver.warm_up(preference_store)
+    await work_queue.start()
+
+
+async def shutdown(drain_timeout=config.SHUTDOWN_DRAIN_TIMEOUT):
+    # Finish queued updates, then close pooled keep-alive connections
+    await work_queue.stop(timeout=drain_timeout)
+    await http_client.aclose()
+    await preference_store.close()
+    await deduplicator.close()
+    await scratch.stop()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await startup()
+    poller = poller_task = None
+    if config.TELEGRAM_INGESTION == "polling":
+        poller = TelegramPoller(work_queue, handle_telegram_message, telegram_chat_id)
+        poller_task = asyncio.create_task(poller.run())
+    yield
+    if poller is not None:
+        poller.stop()
+        poller_task.cancel()
+        await asyncio.gather(poller_task, return_exceptions=True)
+    await shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+morseverse_service = MorseverseService()
 telegram_service = TelegramService()
 whatsapp_service = WhatsAppService()
+pipeline = MessagePipeline(morseverse_service, [telegram_service, whatsapp_service])
 
-logging.basicConfig(level=logging.INFO)
+configure_logging()
+if recorder is not None:
+    http_client.response_hooks.append(recorder.record_response)
 
-def telegram_user_id_to_object_id(user_id):
-    # Convert the Telegram user_id (integer) to a string and encode it
-    user_id_str = str(user_id).encode('utf-8')
 
-    # Create a SHA-256 hash of the user_id and get the hexadecimal digest
-    hash_hex = hashlib.sha256(user_id_str).hexdigest()  # 64-character hex string
+async def handle_telegram_message(data):
+    inbound = normalize_telegram(data)
+    if inbound is None:
+        return {"status": "unhandled"}
+    return await pipeline.handle(inbound)
 
-    # Use the first 24 characters to create an ObjectId
-    object_id = ObjectId(hash_hex[:24])
 
-    return str(object_id)
-    # Convert the 24-character hex string to an ObjectId
+async def handle_whatsapp_message(data):
+    return await pipeline.handle(normalize_whatsapp(data))
 
 
-async def handle_telegram_message(data):
-    try:
-        if "message" in data:
-            chat_id = data["message"]["chat"]["id"]
-            user_id = data["message"]["from"]["id"]
-            user_id = telegram_user_id_to_object_id(user_id)
-
-            # Present language options to the user
-            if data["message"].get("text", "").lower() in ["start", "/start"]:
-                telegram_service.send_language_options(chat_id)
-
-            # Handle text messages
-            elif "text" in data["message"]:
-                question = data["message"]["text"]
-                morseverse_response = telegram_service.send_text_to_morseverse(user_id, question)
-                if morseverse_response is None:
-                    telegram_service.send_message(chat_id, "Server Error, please try again.")
-                    return {"status": "Error (null server answer)"}
-
-                response_message = morseverse_response.get("answer", "Server error, please try later.")
-                links = morseverse_response.get("links", [])
-                if links:
-                    merge_links = '\n'.join(links)
-                    response_message += '\n' + merge_links
-                telegram_service.send_message(chat_id, response_message)
-
-            # Handle voice messages
-            elif "voice" in data["message"]:
-                voice_file_id = data["message"]["voice"]["file_id"]
-
-                # Download the voice message
-                ogg_file = telegram_service.download_voice_file(voice_file_id)
-
-                # Convert the OGG file to WAV
-                wav_file = telegram_service.convert_to_wav(ogg_file)
-
-                # Send the WAV file data to Morseverse API
-                morseverse_response = telegram_service.send_voice_to_morseverse(user_id, wav_file)
-                if morseverse_response is None:
-                    telegram_service.send_message(chat_id, "Server Error, please try again.")
-                    return {"status": "Error (null server answer)"}
-
-                response_message = morseverse_response.get("answer", "Please try again.")
-                links = morseverse_response.get("links", [])
-                if links:
-                    merge_links = '\n'.join(links)
-                    response_message += '\n' + merge_links
-                telegram_service.send_message(chat_id, response_message)
-                telegram_service.send_voice_answer_to_user(chat_id, morseverse_response)
-
-        # Handle language selection callback
-        elif "callback_query" in data:
-            callback_data = data["callback_query"]["data"]
-            chat_id = data["callback_query"]["message"]["chat"]["id"]
-            user_id = str(data["callback_query"]["from"]["id"])
-
-            if callback_data.startswith("set_lang_"):
-                language_code = callback_data.split("_")[-1]
-                telegram_service.set_user_language(user_id, language_code)
-                telegram_service.send_message(chat_id, f"Language set to {language_code}.")
-
-        return {"status": "success"}
+def telegram_chat_id(data):
+    """Return the chat an update belongs to, used to keep per-chat ordering."""
+    if "message" in data:
+        return data["message"]["chat"]["id"]
+    return data["callback_query"]["message"]["chat"]["id"]
 
-    except Exception as e:
-        logging.error(f"Error handling Telegram message: {e}")
-        return {"status": "error", "message": str(e)}
 
-async def handle_whatsapp_message(data):
+async def enqueue_update(channel, update_key, chat_key, handler, data):
+    """Queue an update unless it is a redelivery of one already accepted."""
+    if not await deduplicator.first_seen(channel, update_key):
+        UPDATES.inc(channel=channel, status="duplicate")
+        return {"status": "duplicate"}
     try:
-        from_number = data.get("From")  # e.g., 'whatsapp:+1234567890'
-        message_body = data.get("Body")
-        num_media = int(data.get("NumMedia", "0"))
-        user_id = telegram_user_id_to_object_id(from_number)  # Use the sender's number as the user ID
-        # Handle text messages from WhatsApp
-        if message_body and num_media == 0:
-            logging.info(f"Received text message from {from_number}: {message_body}")
-            # Send text to Morseverse and get response
-            morseverse_response = whatsapp_service.send_text_to_morseverse(user_id, message_body)
-            print(morseverse_response)
-            if morseverse_response is None:
-                response_message = "Server Error, please try again."
-            else:
-                response_message = morseverse_response.get("answer", "Sorry, there was an error processing your message.")
-            # Send response back to the user
-            print(from_number)
-            whatsapp_service.send_message(from_number, response_message)
-
-        # Handle media messages (e.g., voice messages)
-        elif num_media > 0:
-            media_url = data.get("MediaUrl0")
-            media_type = data.get("MediaContentType0")
-            if 'audio' in media_type:
-                logging.info(f"Received voice message from {from_number}: {media_url}")
-                # Download the voice message
-                ogg_file_path = whatsapp_service.download_voice_file(media_url)
-                # Convert the OGG file to WAV
-                wav_file_path = whatsapp_service.convert_to_wav(ogg_file_path)
-                # Send the WAV file data to Morseverse API
-                morseverse_response = whatsapp_service.send_voice_to_morseverse(user_id, wav_file_path)
-                if morseverse_response is None:
-                    response_message = "Server Error, please try again."
-                    whatsapp_service.send_message(from_number, response_message)
-                    return {"status": "Error (null server answer)"}
-                # Send voice response back to the user
-                whatsapp_service.send_voice_answer_to_user(from_number, morseverse_response)
-            else:
-                # Handle other media types if needed
-                whatsapp_service.send_message(from_number, f"Received your {media_type} file.")
-        else:
-            # Handle cases where there is no text or media
-            whatsapp_service.send_message(from_number, "Sorry, I didn't receive any message content.")
+        await work_queue.submit(chat_key, handler, data)
+    except QueueFullError:
+        # The platform will redeliver it; that copy must not count as a duplicate
+        await deduplicator.forget(channel, update_key)
+        raise
+    UPDATES.inc(channel=channel, status="queued")
+    return {"status": "queued"}
 
-        return {"status": "ok"}
-
-    except Exception as e:
-        logging.error(f"Error handling WhatsApp message: {e}")
-        return {"status": "error", "message": str(e)}
 
 @app.post("/webhook")
 async def webhook_handler(request: Request):
+    """
+    Validate the update and queue it for the background workers.
+    Telegram and Twilio get their 200 right away instead of waiting for Morseverse.
+    """
     try:
         # Determine the content type of the incoming request
         content_type = request.headers.get('content-type')
 
         # If the request is JSON (from Telegram)
         if 'application/json' in content_type:
-            data = await request.json()
+            with timed("webhook_parse"):
+                data = await request.json()
+            if recorder is not None:
+                recorder.record_inbound("telegram", data)
             if "message" in data or "callback_query" in data:
                 # Handle Telegram messages
-                return await handle_telegram_message(data)
+                return await enqueue_update(
+                    "telegram", data.get("update_id"), telegram_chat_id(data), handle_telegram_message, data)
             else:
+                UPDATES.inc(channel="telegram", status="unhandled")
                 return {"status": "unhandled"}
 
         # If the request is form data (from WhatsApp via Twilio)
         elif 'application/x-www-form-urlencoded' in content_type:
-            form = await request.form()
-            data = dict(form)
+            with timed("webhook_parse"):
+                form = await request.form()
+                data = dict(form)
+            if recorder is not None:
+                recorder.record_inbound("whatsapp", data)
             if "Body" in data and "From" in data:
-                return await handle_whatsapp_message(data)
+                return await enqueue_update(
+                    "whatsapp", data.get("MessageSid"), data["From"], handle_whatsapp_message, data)
             else:
+                UPDATES.inc(channel="whatsapp", status="unhandled")
                 return {"status": "unhandled"}
 
         else:
             return {"status": "unsupported content type"}
 
+    except QueueFullError as e:
+        # Ask the platform to redeliver later instead of dropping the update
+        logging.warning(str(e))
+        UPDATES.inc(channel="any", status="rejected")
+        return JSONResponse(status_code=503, content={"status": "busy"})
+
     except Exception as e:
         # Log the error
         logging.error(f"An error occurred: {e}")
@@ -186,3 +163,37 @@ def health_check():
     A simple health check endpoint to verify if the server is running.
     """
     return JSONResponse(content={"status": "ok", "message": "Server is running smoothly."})
+
+
+@app.get("/queue")
+def queue_stats():
+    """
+    Depth, throughput and queue-latency figures for the background work queue.
+    """
+    return JSONResponse(content=work_queue.stats())
+
+
+@app.get("/transcoder")
+def transcoder_stats():
+    """
+    Queue depth and per-job timing for the ffmpeg transcoding engine.
+    """
+    return JSONResponse(content=transcoder.stats())
+
+
+registry.add_collector("bot_work_queue", "Background work queue", work_queue.stats)
+registry.add_collector("bot_transcoder", "ffmpeg transcoding engine", transcoder.stats)
+registry.add_collector("bot_tts_cache", "TTS reply cache", tts_cache.stats)
+registry.add_collector("bot_identity_cache", "User-id resolution cache", identity_resolver.stats)
+registry.add_collector("bot_answer_cache", "Morseverse answer cache", answer_cache.stats)
+registry.add_collector("bot_outbound", "Rate-limited outbound dispatcher", dispatcher.stats)
+registry.add_collector("bot_dedup", "Inbound update deduplication", deduplicator.stats)
+registry.add_collector("bot_scratch", "Scratch file space", scratch.stats)
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Stage timings, counters and cache/queue gauges in the Prometheus text format.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from .config import config
+
+
+class ScratchFullError(Exception):
+    """Raised when a scratch file would push the directory past its size cap."""
+
+
+def default_scratch_dir():
+    """A directory on tmpfs when the host has one, so scratch files never touch the disk."""
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "morseverse-bot")
+
+
+def _owner_alive(name):
+    # Scratch files are named "<pid>-<uuid><suffix>"
+    try:
+        pid = int(name.split("-", 1)[0])
+        os.kill(pid, 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ScratchSpace:
+    """
+    Short-lived files for the few jobs that cannot stay in memory (ffmpeg needs a
+    seekable input for MP4/M4A voice notes).
+
+    Every file gets a unique per-process path and is removed when its `file()` block
+    exits, even on error. The directory is capped at `max_bytes`: when a new file does
+    not fit, orphans (left by a process that died, or older than `orphan_age`) are
+    removed least recently used first, and ScratchFullError is raised if that is not
+    enough. A background task sweeps orphans every `sweep_interval` seconds.
+    """
+
+    def __init__(self, root=None, max_bytes=None, orphan_age=None, sweep_interval=None):
+        self.root = root or config.SCRATCH_DIR or default_scratch_dir()
+        self.max_bytes = max_bytes or config.SCRATCH_MAX_BYTES
+        self.orphan_age = orphan_age or config.SCRATCH_ORPHAN_AGE
+        self.sweep_interval = sweep_interval or config.SCRATCH_SWEEP_INTERVAL
+        self._files = OrderedDict()  # path -> size, for files this process holds
+        self._sweeper = None
+        self.bytes = 0
+        self.disk_bytes = 0
+        self.created = 0
+        self.rejected = 0
+        self.orphans_removed = 0
+
+    def _scan(self):
+        """Files in the directory that no block of this process holds, oldest first."""
+        entries = []
+        try:
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if entry.is_file() and entry.path not in self._files:
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.path, entry.name, stat.st_size))
+        except FileNotFoundError:
+            pass
+        entries.sort()
+        return entries
+
+    def _remove_orphans(self, needed=None):
+        """Delete orphans until `needed` bytes are free (all of them when None); update disk usage."""
+        now = time.time()
+        foreign = self._scan()
+        disk_bytes = self.bytes + sum(size for _, _, _, size in foreign)
+        for mtime, path, name, size in foreign:
+            if needed is not None and disk_bytes + needed <= self.max_bytes:
+                break
+            if now - mtime < self.orphan_age and _owner_alive(name):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            disk_bytes -= size
+            self.orphans_removed += 1
+        self.disk_bytes = disk_bytes
+        return disk_bytes
+
+    def sweep(self):
+        """Remove every orphan now. Returns the bytes still in use."""
+        return self._remove_orphans()
+
+    def _reserve(self, size, suffix):
+        if size > self.max_bytes or (self.disk_bytes + size > self.max_bytes
+                                     and self._remove_orphans(size) + size > self.max_bytes):
+            self.rejected += 1
+            raise ScratchFullError(f"Scratch space {self.root} is full ({self.disk_bytes} bytes in use)")
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, f"{os.getpid()}-{uuid.uuid4().hex}{suffix}")
+        self._files[path] = size
+        self.bytes += size
+        self.disk_bytes += size
+        self.created += 1
+        return path
+
+    def _release(self, path):
+        size = self._files.pop(path)
+        self.bytes -= size
+        self.disk_bytes -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @asynccontextmanager
+    async def file(self, data, suffix=""):
+        """Write `data` to a fresh scratch file and yield its path; the file is gone afterwards."""
+        path = self._reserve(len(data), suffix)
+        try:
+            await asyncio.to_thread(_write_file, path, data)
+            yield path
+        finally:
+            self._release(path)
+
+    async def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_periodically())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    async def _sweep_periodically(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except OSError as e:
+                logging.error(f"Error sweeping scratch space {self.root}: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def stats(self):
+        return {
+            "root": self.root,
+            "files": len(self._files),
+            "bytes": self.bytes,
+            "disk_bytes": self.disk_bytes,
+            "max_bytes": self.max_bytes,
+            "created": self.created,
+            "rejected": self.rejected,
+            "orphans_removed": self.orphans_removed,
+        }
+
+
+def remove_legacy_downloads(path=None):
+    """
+    Delete the audio earlier versions left behind in `downloads/`: Telegram voice notes
+    (file_N.oga), converted WAVs and extensionless Twilio media. Every regular file
+    goes; the directory was only ever used for these. Returns how many were removed.
+    """
+    path = config.LEGACY_DOWNLOADS_DIR if path is None else path
+    if not path or not os.path.isdir(path):
+        return 0
+    removed = 0
+    for entry in os.scandir(path):
+        try:
+            if entry.is_file(follow_symlinks=False):
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            # Another worker's startup got to it first
+            pass
+    return removed
+
+
+def _write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+scratch = ScratchSpace()
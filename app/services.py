@@ -1,150 +1,208 @@
-import subprocess
+import asyncio
+import logging
 
-import requests
-import os
-from pydub import AudioSegment
+import httpx
+from . import audio
+from .answer_cache import answer_cache
 from .config import config
-import binascii
+from .http_client import base64_json_body, http_client
+from .metrics import MORSEVERSE_ERRORS, timed
+from .outbound import dispatcher, split_text
+from .preferences import preference_store
+from .resilience import CircuitOpenError, ResilientClient, UpstreamFailure
+from .tts_cache import tts_cache
 
+logger = logging.getLogger(__name__)
+
+
+class MorseverseService:
+    """Morseverse question answering and text-to-speech, shared by every channel."""
 
-class TelegramService:
     def __init__(self):
-        self.TELEGRAM_API_URL = config.TELEGRAM_API_URL
         self.MORSEVERSE_TEXT_API_URL = config.MORSEVERSE_TEXT_API_URL
         self.MORSEVERSE_VOICE_API_URL = config.MORSEVERSE_VOICE_API_URL
         self.MORSEVERSE_VOICE_AI = config.MORSEVERSE_VOICE_AI
         self.COMPANY_ID = config.COMPANY_ID
-        self.user_languages = {}  # Store user language preferences in memory
+        self.preferences = preference_store  # Shared with the other workers
+        self.questions = ResilientClient("morseverse")
+        self.tts = ResilientClient("morseverse_tts")
+        self._synthesizing = {}
 
-    def set_user_language(self, user_id, language_code):
+    async def set_user_language(self, user_id, language_code, platform_id=None):
         """Store the user's selected language."""
-        self.user_languages[user_id] = language_code
+        await self.preferences.set_language(user_id, language_code, platform_id)
 
-    def get_user_language(self, user_id):
+    async def get_user_language(self, user_id):
         """Retrieve the user's selected language, default to 'EN-US' if not set."""
-        return self.user_languages.get(user_id, "EN-US")
-
-    def download_voice_file(self, file_id, save_path='downloads/'):
-        # Get the file path from Telegram
-        file_info_url = self.TELEGRAM_API_URL + f"getFile?file_id={file_id}"
-        file_info = requests.get(file_info_url).json()
-
-        file_path = file_info["result"]["file_path"]
-        download_url = f"https://api.telegram.org/file/bot{config.TELEGRAM_BOT_TOKEN}/{file_path}"
-
-        # Download the file
-        os.makedirs(save_path, exist_ok=True)
-        ogg_file_path = os.path.join(save_path, file_path.split('/')[-1])
-
-        with open(ogg_file_path, 'wb') as f:
-            f.write(requests.get(download_url).content)
-
-        print(f"Downloaded OGG file to {ogg_file_path}")
-        return ogg_file_path
+        return await self.preferences.get_language(user_id)
 
-    def convert_to_wav(self, ogg_file_path):
-        wav_file_path = ogg_file_path.replace('.oga', '.wav').replace('.ogg', '.wav')
-        print(ogg_file_path)
-        # Using ffmpeg to convert OGG to WAV
-        AudioSegment.from_file(ogg_file_path).export(wav_file_path, format='wav')
-
-        print(f"Converted to WAV file at {wav_file_path}")
-        return wav_file_path
-
-    def send_text_to_morseverse(self, user_id, question):
-        language = self.get_user_language(user_id)
-        print(self.COMPANY_ID)
+    async def send_text_to_morseverse(self, user_id, question, language):
         payload = {
             "companyId": self.COMPANY_ID,
             "userId": user_id,
             "lang": language,
             "question": question
         }
-        try:
-            response = requests.post(self.MORSEVERSE_TEXT_API_URL, json=payload)
-            if response.status_code == 200:
-                try:
-                    return response.json()  # Attempt to parse the JSON response
-                except ValueError:
-                    # Handle cases where the response is not JSON
-                    return {"error": "Invalid JSON response from Morseverse API"}
-            else:
-                # Handle HTTP errors
-                return {"error": f"HTTP error {response.status_code}: {response.text}"}
-        except requests.exceptions.RequestException as e:
-            # Handle any request-related errors (e.g., network issues)
-            return {"error": f"Request failed: {str(e)}"}
 
-    def send_voice_to_morseverse(self, user_id, wav_file_path):
-        language = self.get_user_language(user_id)
-        with open(wav_file_path, 'rb') as wav_file:
-            wav_data = wav_file.read()
-        import base64
-        wav_data_base64 = base64.b64encode(wav_data).decode('utf-8')
-        payload = {
+        async def fetch():
+            # Timed here so cache hits stay out of the Morseverse stage
+            with timed("morseverse_text"):
+                return await self._ask(lambda: http_client.post(self.MORSEVERSE_TEXT_API_URL, json=payload))
+
+        return await answer_cache.get_or_fetch(self.COMPANY_ID, language, question, fetch)
+
+    async def send_voice_to_morseverse(self, user_id, audio_data, language, audio_format="wav"):
+        fields = {
             "companyId": self.COMPANY_ID,
             "userId": user_id,
             "lang": language,
-            "wavData": wav_data_base64
         }
+        # The streamed body can only be read once, so every attempt builds its own
+        with timed("morseverse_voice"):
+            return await self._ask(lambda: http_client.post(
+                self.MORSEVERSE_VOICE_API_URL, **voice_upload(fields, audio_data, audio_format)))
+
+    async def _ask(self, send):
+        """
+        Send a question through the resilient client and return the parsed answer,
+        or an {"error": ...} dict; "unavailable" is set when the breaker is open.
+        """
+        try:
+            response = await self.questions.call(
+                send, idempotent=config.MORSEVERSE_QUESTIONS_IDEMPOTENT, hedge=True)
+        except CircuitOpenError as e:
+            MORSEVERSE_ERRORS.inc(kind="circuit_open")
+            return {"error": str(e), "unavailable": True}
+        except UpstreamFailure as e:
+            response = e.response
+        except httpx.HTTPError as e:
+            # Handle any request-related errors (e.g., network issues, deadline)
+            MORSEVERSE_ERRORS.inc(kind="request_failed")
+            return {"error": f"Request failed: {str(e)}"}
+        logger.debug(f"Morseverse response: {response.status_code}")
+        if response.status_code != 200:
+            # Handle HTTP errors
+            MORSEVERSE_ERRORS.inc(kind="http_status")
+            return {"error": f"HTTP error {response.status_code}: {response.text}"}
+        try:
+            return response.json()  # Attempt to parse the JSON response
+        except ValueError:
+            # Handle cases where the response is not JSON
+            MORSEVERSE_ERRORS.inc(kind="invalid_json")
+            return {"error": "Invalid JSON response from Morseverse API"}
+
+    async def synthesize_voice(self, text, cache_key):
+        """
+        Return the OGG/Opus reply for `text`, from the TTS cache when possible.
+        Returns None when the text-to-audio API fails.
+        """
+        ogg_data = await tts_cache.get(cache_key)
+        if ogg_data is not None:
+            return ogg_data
+        # Concurrent misses for the same reply share one TTS call and encode
+        task = self._synthesizing.get(cache_key)
+        if task is None:
+            task = self._synthesizing[cache_key] = asyncio.ensure_future(self._synthesize(text, cache_key))
+            task.add_done_callback(lambda _: self._synthesizing.pop(cache_key, None))
+        return await asyncio.shield(task)
+
+    async def _synthesize(self, text, cache_key):
+        # Make a POST request to the text-to-audio API
+        try:
+            with timed("tts"):
+                response = await self.tts.call(
+                    lambda: http_client.post(self.MORSEVERSE_VOICE_AI, json={"text": text}),
+                    idempotent=True, hedge=True)
+        except (CircuitOpenError, UpstreamFailure, httpx.HTTPError) as e:
+            logger.warning(f"Text-to-audio request failed: {e}")
+            return None
+        if response.status_code != 200:
+            return None
+        # Assume the API returns the WAV file directly in the response content
+        ogg_data = await self.convert_wav_to_ogg(response.content)
+        await tts_cache.put(cache_key, ogg_data)
+        return ogg_data
+
+    async def convert_to_wav(self, ogg_data, media_type=None):
+        """Convert OGG (or another voice-note container) bytes to WAV bytes with ffmpeg."""
+        wav_data = await audio.to_wav(ogg_data, media_type)
+        logger.debug(f"Converted to WAV ({len(wav_data)} bytes)")
+        return wav_data
+
+    async def convert_wav_to_ogg(self, wav_data):
+        # Use ffmpeg to convert the WAV bytes to OGG with OPUS encoding
+        return await audio.to_ogg_opus(wav_data)
 
-        response = requests.post(self.MORSEVERSE_VOICE_API_URL, json=payload)
-        print(response)
-        return response.json()
 
-    def send_voice_answer_to_user(self, chat_id, morseverse_response):
-        # Prepare the text for the API request
-        voice_answer_text = morseverse_response.get("voice_answer", "Please try again.")
+class TelegramService:
+    """Telegram Bot API adapter: download voice notes and deliver replies."""
 
-        # Make a POST request to the text-to-audio API
-        response = requests.post(self.MORSEVERSE_VOICE_AI, json={"text": voice_answer_text})
+    channel = "telegram"
+    # sendVoice returns a file_id that can be sent again instead of re-uploading
+    reuses_file_ids = True
+    # Voice questions get the text answer as well as the spoken one
+    sends_text_with_voice = True
 
-        if response.status_code == 200:
-            # Assume the API returns the WAV file directly in the response content
-            wav_data = response.content
-            wav_file_path = "response.wav"
+    def __init__(self):
+        self.TELEGRAM_API_URL = config.TELEGRAM_API_URL
 
-            # Save the response WAV file locally
-            with open(wav_file_path, 'wb') as f:
-                f.write(wav_data)
-            ogg_file_path = wav_file_path.replace('.wav', '.ogg')
-            self.convert_wav_to_ogg(wav_file_path, ogg_file_path)
-            # Send the WAV file back to the user via Telegram
-            self.send_voice(chat_id, ogg_file_path)
+    async def download_voice_file(self, file_id):
+        """Download a voice message from Telegram and return the OGG bytes."""
+        with timed("download"):
+            # Get the file path from Telegram
+            file_info_url = self.TELEGRAM_API_URL + "getFile"
+            file_info = (await http_client.get(file_info_url, params={"file_id": file_id})).json()
 
-            # Optionally, delete the temporary WAV file
-            os.remove(ogg_file_path)
+            file_path = file_info["result"]["file_path"]
+            download_url = f"{config.TELEGRAM_FILE_URL}{file_path}"
 
-    def convert_wav_to_ogg(self, wav_file_path, output_ogg_path):
-        # Use ffmpeg to convert the WAV file to OGG with OPUS encoding
-        subprocess.run(['ffmpeg', '-i', wav_file_path, '-c:a', 'libopus', output_ogg_path], check=True)
+            ogg_data = (await http_client.get(download_url)).content
+        logger.debug(f"Downloaded OGG file {file_path} ({len(ogg_data)} bytes)")
+        return ogg_data
 
-    def send_voice(self, chat_id, ogg_file_path):
+    async def send_voice(self, chat_id, voice):
+        """Send OGG bytes, or the file_id of an earlier upload, as a voice message."""
         url = self.TELEGRAM_API_URL + "sendVoice"
+        data = {
+            'chat_id': chat_id
+        }
+        with timed("send_voice"):
+            if isinstance(voice, str):
+                data['voice'] = voice
+                response = await dispatcher.send(
+                    self.channel, chat_id, lambda: http_client.post(url, data=data))
+            else:
+                files = {
+                    'voice': ('voice.ogg', voice, 'audio/ogg')
+                }
+                response = await dispatcher.send(
+                    self.channel, chat_id, lambda: http_client.post(url, data=data, files=files))
+        return response.json()
 
-        with open(ogg_file_path, 'rb') as voice_file:
-            files = {
-                'voice': voice_file
-            }
-            data = {
-                'chat_id': chat_id
-            }
-
-            response = requests.post(url, data=data, files=files)
+    @staticmethod
+    def voice_delivered(result):
+        """Whether a sendVoice response reports the voice message as sent."""
+        return bool(result.get("ok"))
 
-        return response.json()
+    @staticmethod
+    def voice_file_id(result):
+        """The reusable file_id from a sendVoice response, if any."""
+        return result.get("result", {}).get("voice", {}).get("file_id")
 
-    def send_message(self, chat_id, text):
+    async def send_message(self, chat_id, text):
+        """Send `text`, split into in-order messages when it exceeds Telegram's limit."""
         url = self.TELEGRAM_API_URL + "sendMessage"
-        payload = {
-            "chat_id": chat_id,
-            "text": text
-        }
-        requests.post(url, json=payload)
-
-    def send_language_options(self, chat_id):
+        with timed("send_text"):
+            for chunk in split_text(text, config.TELEGRAM_MAX_TEXT_LENGTH):
+                payload = {
+                    "chat_id": chat_id,
+                    "text": chunk
+                }
+                await dispatcher.send(self.channel, chat_id, lambda: http_client.post(url, json=payload))
+
+    async def send_language_options(self, chat_id):
         """Send language options to the user."""
-        print("I am setting language")
+        logger.debug(f"Sending language options to chat {chat_id}")
         url = self.TELEGRAM_API_URL + "sendMessage"
         payload = {
             "chat_id": chat_id,
@@ -157,142 +215,92 @@ class TelegramService:
                 ]
             }
         }
-        requests.post(url, json=payload)
+        await dispatcher.send(self.channel, chat_id, lambda: http_client.post(url, json=payload))
 
 
 class WhatsAppService:
+    """Twilio WhatsApp adapter: download voice notes and deliver replies."""
+
+    channel = "whatsapp"
+    reuses_file_ids = False
+    sends_text_with_voice = False
+
     def __init__(self):
-        self.TWILIO_API_URL = "https://api.twilio.com/2010-04-01/Accounts"
-        self.MORSEVERSE_TEXT_API_URL = config.MORSEVERSE_TEXT_API_URL
-        self.MORSEVERSE_VOICE_API_URL = config.MORSEVERSE_VOICE_API_URL
-        self.MORSEVERSE_VOICE_AI = config.MORSEVERSE_VOICE_AI
+        self.TWILIO_API_URL = config.TWILIO_API_URL
         self.TWILIO_ACCOUNT_SID = config.TWILIO_ACCOUNT_SID
         self.TWILIO_AUTH_TOKEN = config.TWILIO_AUTH_TOKEN
         self.TWILIO_WHATSAPP_NUMBER = config.TWILIO_WHATSAPP_NUMBER
-        self.COMPANY_ID = config.COMPANY_ID
-        self.user_languages = {}  # Store user language preferences in memory
-
-    def set_user_language(self, user_id, language_code):
-        """Store the user's selected language."""
-        self.user_languages[user_id] = language_code
 
-    def get_user_language(self, user_id):
-        """Retrieve the user's selected language, default to 'EN-US' if not set."""
-        return self.user_languages.get(user_id, "EN-US")
+    async def send_message(self, to_number, message_body):
+        """Send a message via Twilio WhatsApp API, split in order when it is too long for one."""
+        url = f"{self.TWILIO_API_URL}/{self.TWILIO_ACCOUNT_SID}/Messages.json"
+        auth = (self.TWILIO_ACCOUNT_SID, self.TWILIO_AUTH_TOKEN)
+        with timed("send_text"):
+            for chunk in split_text(message_body, config.WHATSAPP_MAX_TEXT_LENGTH):
+                payload = {
+                    "Body": chunk,
+                    "From": f"{self.TWILIO_WHATSAPP_NUMBER}",
+                    "To": f"{to_number}"
+                }
+                response = await dispatcher.send(
+                    self.channel, to_number, lambda: http_client.post(url, data=payload, auth=auth))
+        return response.json()
 
-    def send_message(self, to_number, message_body):
-        """Send a message via Twilio WhatsApp API."""
+    async def download_voice_file(self, media_url):
+        """Download the voice file from Twilio and return its bytes."""
+        with timed("download"):
+            ogg_data = (await http_client.get(media_url)).content
+        logger.debug(f"Downloaded OGG file {media_url} ({len(ogg_data)} bytes)")
+        return ogg_data
+
+    async def send_voice(self, to_number, ogg_data):
+        """
+        Send a voice message via Twilio WhatsApp API. Twilio only takes media by
+        MediaUrl, so an attached file is usually refused; see `voice_delivered`.
+        """
         url = f"{self.TWILIO_API_URL}/{self.TWILIO_ACCOUNT_SID}/Messages.json"
-        print(url)
+        files = {'Media': ('voice.ogg', ogg_data, 'audio/ogg')}
         payload = {
-            "Body": message_body,
             "From": f"{self.TWILIO_WHATSAPP_NUMBER}",
             "To": f"{to_number}"
         }
-        print(payload)
-
-        auth = (self.TWILIO_ACCOUNT_SID, self.TWILIO_AUTH_TOKEN)
-        response = requests.post(url, data=payload, auth=auth)
+        with timed("send_voice"):
+            response = await dispatcher.send(self.channel, to_number, lambda: http_client.post(
+                url, data=payload, files=files, auth=(self.TWILIO_ACCOUNT_SID, self.TWILIO_AUTH_TOKEN)))
         return response.json()
 
-    def download_voice_file(self, media_url, save_path='downloads/'):
-        """Download the voice file from Twilio."""
-        os.makedirs(save_path, exist_ok=True)
-        ogg_file_path = os.path.join(save_path, media_url.split('/')[-1])
-        with open(ogg_file_path, 'wb') as f:
-            f.write(requests.get(media_url).content)
-        print(f"Downloaded OGG file to {ogg_file_path}")
-        return ogg_file_path
-
-    def convert_to_wav(self, ogg_file_path):
-        """Convert OGG file to WAV format."""
-        wav_file_path = ogg_file_path.replace('.ogg', '.wav')
-        AudioSegment.from_file(ogg_file_path).export(wav_file_path, format='wav')
-        print(f"Converted to WAV file at {wav_file_path}")
-        return wav_file_path
-
-    def send_text_to_morseverse(self, user_id, question):
-        """Send text question to Morseverse API."""
-        language = self.get_user_language(user_id)
-        # print(self.COMPANY_ID)
-        payload = {
-            "companyId": self.COMPANY_ID,
-            "userId": user_id,
-            "lang": language,
-            "question": question
-        }
-        # print(payload)
-
-        try:
-            response = requests.post(self.MORSEVERSE_TEXT_API_URL, json=payload)
-            if response.status_code == 200:
-                try:
-                    return response.json()  # Attempt to parse the JSON response
-                except ValueError:
-                    # Handle cases where the response is not JSON
-                    return {"error": "Invalid JSON response from Morseverse API"}
-            else:
-                # Handle HTTP errors
-                return {"error": f"HTTP error {response.status_code}: {response.text}"}
-        except requests.exceptions.RequestException as e:
-            # Handle any request-related errors (e.g., network issues)
-            return {"error": f"Request failed: {str(e)}"}
-
+    @staticmethod
+    def voice_delivered(result):
+        """Twilio returns the message "sid" on success and a "code"/"message" error otherwise."""
+        return bool(result.get("sid"))
 
-def send_voice_to_morseverse(self, user_id, wav_file_path):
-    """Send voice data to Morseverse API."""
-    language = self.get_user_language(user_id)
-    with open(wav_file_path, 'rb') as wav_file:
-        wav_data = wav_file.read()
-    import base64
-    wav_data_base64 = base64.b64encode(wav_data).decode('utf-8')
-    payload = {
-        "companyId": self.COMPANY_ID,
-        "userId": user_id,
-        "lang": language,
-        "wavData": wav_data_base64
-    }
-
-    response = requests.post(self.MORSEVERSE_VOICE_API_URL, json=payload)
-    return response.json()
-
-
-def send_voice_answer_to_user(self, to_number, morseverse_response):
-    """Send the voice response back to the user."""
-    voice_answer_text = morseverse_response.get("voice_answer", "Please try again.")
-    response = requests.post(self.MORSEVERSE_VOICE_AI, json={"text": voice_answer_text})
-
-    if response.status_code == 200:
-        wav_data = response.content
-        wav_file_path = "response.wav"
-        with open(wav_file_path, 'wb') as f:
-            f.write(wav_data)
-        ogg_file_path = wav_file_path.replace('.wav', '.ogg')
-        self.convert_wav_to_ogg(wav_file_path, ogg_file_path)
-        self.send_voice(to_number, ogg_file_path)
-        os.remove(ogg_file_path)
-
-
-def convert_wav_to_ogg(self, wav_file_path, output_ogg_path):
-    """Convert WAV file to OGG format."""
-    subprocess.run(['ffmpeg', '-i', wav_file_path, '-c:a', 'libopus', output_ogg_path], check=True)
-
-
-def send_voice(self, to_number, ogg_file_path):
-    """Send a voice message via Twilio WhatsApp API."""
-    url = f"{self.TWILIO_API_URL}/{self.TWILIO_ACCOUNT_SID}/Messages.json"
-    with open(ogg_file_path, 'rb') as voice_file:
-        files = {'Media': voice_file}
-        payload = {
-            "From": f"whatsapp:{self.TWILIO_WHATSAPP_NUMBER}",
-            "To": f"whatsapp:{to_number}"
-        }
-        response = requests.post(url, data=payload, files=files,
-                                 auth=(self.TWILIO_ACCOUNT_SID, self.TWILIO_AUTH_TOKEN))
-    return response.json()
+    @staticmethod
+    def voice_file_id(result):
+        return None
 
-
-def send_language_options(self, to_number):
-    """Send language options to the user."""
-    message_body = "Please select your language:\n1. Italian\n2. English"
-    self.send_message(to_number, message_body)
+    async def send_language_options(self, to_number):
+        """Send language options to the user."""
+        message_body = "Please select your language:\n1. Italian\n2. English"
+        await self.send_message(to_number, message_body)
+
+
+def voice_upload(fields, audio_data, audio_format):
+    """
+    Request arguments for a voice question in the MORSEVERSE_VOICE_UPLOAD mode.
+
+    "json" streams a JSON body with the audio base64-encoded on the fly; "multipart"
+    sends the raw audio as a file part. WAV goes in "wavData" as before; any other
+    format (e.g. the original OGG/Opus) goes in "audioData" with an "audioFormat" field.
+    """
+    if audio_format == "wav":
+        data_field = "wavData"
+    else:
+        data_field = "audioData"
+        fields = {**fields, "audioFormat": audio_format}
+
+    if config.MORSEVERSE_VOICE_UPLOAD == "multipart":
+        files = {data_field: (f"voice.{audio_format}", audio_data, f"audio/{audio_format}")}
+        return {"data": fields, "files": files}
+
+    content, headers = base64_json_body(fields, data_field, audio_data)
+    return {"content": content, "headers": headers}
@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+
+class TTSCache:
+    """
+    Content-addressed cache of encoded voice replies.
+
+    Entries are keyed on (text, language, codec) and hold the final OGG/Opus bytes,
+    so a repeated answer skips both the TTS call and ffmpeg. The memory tier is an
+    LRU capped in bytes; the optional disk tier keeps entries for `disk_ttl` seconds.
+    Telegram file_ids are remembered per key so the same audio is only uploaded once.
+    """
+
+    def __init__(self, max_bytes=None, disk_dir=None, disk_ttl=None, max_file_ids=None):
+        self.max_bytes = config.TTS_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.disk_dir = config.TTS_CACHE_DIR if disk_dir is None else disk_dir
+        self.disk_ttl = config.TTS_CACHE_TTL if disk_ttl is None else disk_ttl
+        self.max_file_ids = config.TTS_FILE_ID_CACHE_SIZE if max_file_ids is None else max_file_ids
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._file_ids = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.file_id_hits = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(text, language, codec="opus"):
+        raw = "\x1f".join([codec, language or "", text]).encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.ogg")
+
+    def _remember(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.disk_ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key, data):
+        # A temp file of its own, so concurrent puts of one key never share a name
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, prefix=f"{key}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._disk_path(key))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    async def get(self, key):
+        """Return the cached audio for `key`, or None."""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return data
+        if self.disk_dir:
+            data = await asyncio.to_thread(self._read_disk, key)
+            if data is not None:
+                self.disk_hits += 1
+                self._remember(key, data)
+                return data
+        self.misses += 1
+        return None
+
+    async def put(self, key, data):
+        self._remember(key, data)
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, key, data)
+            except OSError as e:
+                # The memory tier still has it; a full or read-only disk must not fail the reply
+                logger.warning(f"Could not write TTS cache entry to disk: {e}")
+
+    def get_file_id(self, key):
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            self._file_ids.move_to_end(key)
+            self.file_id_hits += 1
+        return file_id
+
+    def set_file_id(self, key, file_id):
+        self._file_ids[key] = file_id
+        self._file_ids.move_to_end(key)
+        while len(self._file_ids) > self.max_file_ids:
+            self._file_ids.popitem(last=False)
+
+    def forget_file_id(self, key):
+        self._file_ids.pop(key, None)
+
+    def sweep_disk(self):
+        """Delete disk entries older than the TTL. Returns the number removed."""
+        if not self.disk_dir:
+            return 0
+        removed = 0
+        now = time.time()
+        for entry in os.scandir(self.disk_dir):
+            try:
+                if entry.is_file() and now - entry.stat().st_mtime > self.disk_ttl:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "file_ids": len(self._file_ids),
+            "file_id_hits": self.file_id_hits,
+        }
+
+
+tts_cache = TTSCache()
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+import zlib
+from collections import deque
+
+from .config import config
+from .metrics import QUEUE_WAIT_SECONDS, new_trace
+
+
+class QueueFullError(Exception):
+    """Raised when a job cannot be enqueued before the enqueue timeout."""
+
+
+class WorkQueue:
+    """Bounded pool of async workers for webhook updates.
+
+    Every worker owns one lane. Jobs are routed to a lane by key (the chat), so
+    updates from the same chat are handled in arrival order while different
+    chats are processed concurrently.
+    """
+
+    def __init__(self, workers=None, max_size=None, enqueue_timeout=None):
+        self.workers = workers or config.WORKER_COUNT
+        self.max_size = max_size or config.WORK_QUEUE_SIZE
+        self.enqueue_timeout = config.ENQUEUE_TIMEOUT if enqueue_timeout is None else enqueue_timeout
+        self._lane_size = max(1, -(-self.max_size // self.workers))
+        self._lanes = []
+        self._tasks = []
+        self._latencies = deque(maxlen=1000)
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.in_flight = 0
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._lanes = [asyncio.Queue(maxsize=self._lane_size) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(lane)) for lane in self._lanes]
+
+    async def stop(self, timeout=None):
+        """Let queued jobs finish (up to `timeout` seconds), then cancel the workers."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(lane.join() for lane in self._lanes)), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Work queue stopped with {self.depth()} jobs still pending")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _lane(self, key):
+        return self._lanes[zlib.crc32(str(key).encode("utf-8")) % len(self._lanes)]
+
+    async def submit(self, key, handler, *args, block=False):
+        """
+        Queue `handler(*args)` behind earlier jobs with the same key. With `block` the
+        caller waits for room in the lane instead of getting QueueFullError.
+        """
+        lane = self._lane(key)
+        job = (time.monotonic(), handler, args)
+        try:
+            if block:
+                await lane.put(job)
+            elif self.enqueue_timeout:
+                await asyncio.wait_for(lane.put(job), self.enqueue_timeout)
+            else:
+                lane.put_nowait(job)
+        except (asyncio.TimeoutError, asyncio.QueueFull):
+            self.rejected += 1
+            raise QueueFullError(f"Work queue is full ({self.depth()} jobs pending)")
+        self.enqueued += 1
+
+    async def _worker(self, lane):
+        while True:
+            enqueued_at, handler, args = await lane.get()
+            waited = time.monotonic() - enqueued_at
+            self._latencies.append(waited)
+            QUEUE_WAIT_SECONDS.observe(waited)
+            new_trace(enqueued_at)
+            self.in_flight += 1
+            try:
+                await handler(*args)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Error processing queued job: {e}")
+            finally:
+                self.in_flight -= 1
+                lane.task_done()
+
+    def depth(self):
+        return sum(lane.qsize() for lane in self._lanes)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            "workers": self.workers,
+            "max_size": self.max_size,
+            "depth": self.depth(),
+            "in_flight": self.in_flight,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "queue_latency_p50": percentile(0.50),
+            "queue_latency_p95": percentile(0.95),
+            "queue_latency_max": latencies[-1] if latencies else 0.0,
+        }
+
+
+work_queue = WorkQueue()
@@ -0,0 +1,113 @@
+"""
+Measure how long the bot takes to start.
+
+    python -m bench.cold_start --runs 5 --workers 1 --workers 4
+
+For each run a fresh interpreter is used, so nothing is cached in-process:
+
+- import: seconds to `import app.routes` (builds every singleton), plus the modules
+  with the largest self time from `python -X importtime`
+- ready: seconds from launching `main.py` until GET /health answers
+- stop: seconds from SIGTERM until every process has exited
+"""
+import argparse
+import os
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.routes; print(time.perf_counter() - t)"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(env):
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env, top):
+    """(self seconds, module) for the `top` modules with the largest self import time."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.routes"], env=env,
+                            capture_output=True, text=True, check=True)
+    timings = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            timings.append((int(match.group(1)) / 1e6, match.group(4)))
+    return sorted(timings, reverse=True)[:top]
+
+
+def measure_server(env, workers, timeout):
+    """Start main.py with `workers` processes; return (seconds until healthy, seconds to stop)."""
+    port = free_port()
+    started_at = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "main.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"main.py exited with status {process.returncode}")
+            if time.perf_counter() - started_at > timeout:
+                raise RuntimeError(f"main.py was not healthy after {timeout}s")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=0.5).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.02)
+        ready = time.perf_counter() - started_at
+        stopping_at = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=timeout)
+        return ready, time.perf_counter() - stopping_at
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bot import and startup time.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--workers", type=int, action="append",
+                        help="worker counts to start (repeatable, default: 1)")
+    parser.add_argument("--top", type=int, default=10, help="slowest modules to list")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    scratch_dir = tempfile.mkdtemp(prefix="cold-start-")
+    env = {**os.environ,
+           "PREFERENCE_DB_PATH": os.path.join(scratch_dir, "preferences.db"),
+           "SCRATCH_DIR": os.path.join(scratch_dir, "scratch"),
+           "LOG_LEVEL": "WARNING"}
+
+    imports = [measure_import(env) for _ in range(args.runs)]
+    print(f"import app.routes: median {statistics.median(imports):.3f}s, max {max(imports):.3f}s")
+    for seconds, module in slowest_imports(env, args.top):
+        print(f"  {seconds * 1000:8.1f} ms  {module}")
+
+    print(f"{'workers':>7} {'ready p50 s':>12} {'ready max s':>12} {'stop p50 s':>11}")
+    for workers in args.workers or [1]:
+        runs = [measure_server(env, workers, args.timeout) for _ in range(args.runs)]
+        ready = [r for r, _ in runs]
+        stop = [s for _, s in runs]
+        print(f"{workers:>7} {statistics.median(ready):>12.3f} {max(ready):>12.3f} {statistics.median(stop):>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import asyncio
+import io
+import math
+import struct
+import threading
+import time
+import wave
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+
+def sine_wav(seconds=1.0, rate=16000, frequency=440):
+    """A small mono PCM WAV, used as the TTS response body."""
+    frames = int(seconds * rate)
+    samples = b"".join(
+        struct.pack("<h", int(12000 * math.sin(2 * math.pi * frequency * i / rate))) for i in range(frames)
+    )
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(samples)
+    return buffer.getvalue()
+
+
+class MockUpstreams:
+    """
+    Local stand-ins for the Telegram Bot API, Twilio Messages API, the Morseverse
+    text/voice endpoints and the TTS endpoint, served from one uvicorn instance
+    on a background thread. Each upstream has its own artificial latency (seconds).
+
+    `on_delivery(destination, kind)` is called for every outbound message the bot
+    sends, which is how the benchmark knows a reply has reached the "user".
+    """
+
+    def __init__(self, port, voice_ogg=b"", telegram_latency=0.0, twilio_latency=0.0,
+                 morseverse_latency=0.0, tts_latency=0.0, on_delivery=None):
+        self.port = port
+        self.voice_ogg = voice_ogg
+        self.telegram_latency = telegram_latency
+        self.twilio_latency = twilio_latency
+        self.morseverse_latency = morseverse_latency
+        self.tts_latency = tts_latency
+        self.on_delivery = on_delivery or (lambda destination, kind: None)
+        self.tts_wav = sine_wav()
+        self.requests = 0
+        self._server = None
+        self._thread = None
+        self.app = self._build_app()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def env(self):
+        """Environment variables that point the bot at these stand-ins."""
+        return {
+            "TELEGRAM_API_BASE": self.base_url + "/telegram",
+            "TWILIO_API_URL": self.base_url + "/twilio/2010-04-01/Accounts",
+            "MORSEVERSE_BASE_URL": self.base_url + "/morseverse/api/v1",
+            "MORSEVERSE_VOICE_AI": self.base_url + "/morseverse/ai_agent/text_to_audio/",
+            # The stand-ins don't rate limit, so neither should the bot's outbound dispatcher
+            "TELEGRAM_RATE_GLOBAL": "100000",
+            "TWILIO_RATE_GLOBAL": "100000",
+        }
+
+    def _build_app(self):
+        app = FastAPI()
+
+        @app.middleware("http")
+        async def count_requests(request, call_next):
+            self.requests += 1
+            return await call_next(request)
+
+        @app.post("/telegram/bot{token}/sendMessage")
+        async def telegram_send_message(token: str, request: Request):
+            await asyncio.sleep(self.telegram_latency)
+            body = await request.json()
+            self.on_delivery(str(body["chat_id"]), "text")
+            return {"ok": True, "result": {"message_id": 1}}
+
+        @app.post("/telegram/bot{token}/sendVoice")
+        async def telegram_send_voice(token: str, request: Request):
+            await asyncio.sleep(self.telegram_latency)
+            form = await request.form()
+            self.on_delivery(str(form["chat_id"]), "voice")
+            return {"ok": True, "result": {"message_id": 2, "voice": {"file_id": f"voice-{time.monotonic_ns()}"}}}
+
+        @app.post("/telegram/bot{token}/deleteWebhook")
+        async def telegram_delete_webhook(token: str):
+            return {"ok": True, "result": True}
+
+        @app.get("/telegram/bot{token}/getFile")
+        async def telegram_get_file(token: str, file_id: str):
+            await asyncio.sleep(self.telegram_latency)
+            return {"ok": True, "result": {"file_id": file_id, "file_path": f"voice/{file_id}.oga"}}
+
+        @app.get("/telegram/file/bot{token}/voice/{name}")
+        async def telegram_download(token: str, name: str):
+            await asyncio.sleep(self.telegram_latency)
+            return Response(self.voice_ogg, media_type="audio/ogg")
+
+        @app.post("/twilio/2010-04-01/Accounts/{sid}/Messages.json")
+        async def twilio_messages(sid: str, request: Request):
+            await asyncio.sleep(self.twilio_latency)
+            form = await request.form()
+            if "Body" not in form and "MediaUrl" not in form:
+                # What Twilio answers to an attached file without a MediaUrl
+                return Response('{"code": 21602, "message": "Message body is required.", "status": 400}',
+                                status_code=400, media_type="application/json")
+            kind = "voice" if "MediaUrl" in form else "text"
+            self.on_delivery(str(form["To"]).replace("whatsapp:", ""), kind)
+            return {"sid": f"SM{time.monotonic_ns()}", "status": "queued"}
+
+        @app.get("/twilio/media/{name}")
+        async def twilio_media(name: str):
+            await asyncio.sleep(self.twilio_latency)
+            return Response(self.voice_ogg, media_type="audio/ogg")
+
+        @app.post("/morseverse/api/v1/textusermessage")
+        async def morseverse_text(request: Request):
+            await asyncio.sleep(self.morseverse_latency)
+            body = await request.json()
+            return {"answer": f"Answer to: {body['question']}", "links": ["https://example.com/faq"],
+                    "voice_answer": f"Answer to: {body['question']}"}
+
+        @app.post("/morseverse/api/v1/usermessage")
+        async def morseverse_voice(request: Request):
+            await asyncio.sleep(self.morseverse_latency)
+            await request.body()
+            return {"answer": "Answer to your voice message", "links": [],
+                    "voice_answer": "Answer to your voice message"}
+
+        @app.post("/morseverse/ai_agent/text_to_audio/")
+        async def text_to_audio(request: Request):
+            await asyncio.sleep(self.tts_latency)
+            await request.json()
+            return Response(self.tts_wav, media_type="audio/wav")
+
+        return app
+
+    def start(self):
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
@@ -0,0 +1,225 @@
+"""
+Replay recorded webhook traffic through the bot with no network, optionally under a profiler.
+
+Record on a live instance with RECORD_PATH=traffic.jsonl (see app/recording.py), then:
+
+    python -m bench.replay traffic.jsonl --speedup 10
+    python -m bench.replay traffic.jsonl --speedup 0 --profile replay.prof
+    python -m bench.replay traffic.jsonl --profiler pyinstrument
+
+A plain capture of Telegram updates, one update per line, can be replayed the same way;
+its upstream calls are all answered with a stub reply.
+
+Inbound updates are POSTed to /webhook at their recorded offsets divided by --speedup
+(0 sends them back to back). Every upstream call (Telegram, Twilio, Morseverse, TTS) is
+answered from the recording, in recorded order per method and URL, after the recorded
+latency divided by --speedup. Audio that was not recorded (RECORD_AUDIO unset) is
+replaced by a stock tone. ffmpeg still runs for real. The outbound rate limits and
+the other settings come from the environment as usual.
+"""
+import argparse
+import asyncio
+import base64
+import cProfile
+import io
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+
+import httpx
+
+
+def load(path):
+    """
+    (inbound events in order, recorded upstream responses keyed by (method, url)).
+    A plain capture of Telegram updates, one update per line, loads as inbound events
+    with no upstream responses.
+    """
+    inbound = []
+    upstream = defaultdict(deque)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            if "update_id" in event:
+                event = {"t": 0.0, "type": "inbound", "channel": "telegram", "data": event}
+            if event.get("type") == "inbound":
+                inbound.append(event)
+            elif event.get("type") == "upstream":
+                upstream[(event["method"], event["url"])].append(event)
+    return inbound, upstream
+
+
+def stock_clip(content_type, seconds=3):
+    """A tone standing in for recorded audio: WAV when `content_type` says so, else OGG/Opus."""
+    if shutil.which("ffmpeg") is None:
+        return b""
+    output_args = ["-f", "wav"] if "wav" in content_type else ["-c:a", "libopus", "-f", "ogg"]
+    return subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi",
+         "-i", f"sine=frequency=300:duration={seconds}", *output_args, "pipe:1"],
+        check=True, capture_output=True,
+    ).stdout
+
+
+class RecordedUpstreams:
+    """httpx transport handler that answers from a recording instead of the network."""
+
+    def __init__(self, upstream, speedup):
+        from app.recording import sanitize_url
+
+        self.sanitize_url = sanitize_url
+        self.speedup = speedup
+        self.upstream = upstream
+        # Fallback for URLs whose query differs from the recording (e.g. another file_id)
+        self.by_path = defaultdict(list)
+        for (method, url), events in upstream.items():
+            self.by_path[(method, urlsplit(url).path)].extend(events)
+        self.matched = 0
+        self.approximate = 0
+        self.missing = defaultdict(int)
+        self._clips = {}
+
+    def _find(self, method, url):
+        events = self.upstream.get((method, url))
+        if events:
+            self.matched += 1
+            # Keep the last response around for calls beyond what was recorded
+            return events.popleft() if len(events) > 1 else events[0]
+        candidates = self.by_path.get((method, urlsplit(url).path))
+        if candidates:
+            self.approximate += 1
+            return candidates[-1]
+        self.missing[(method, url)] += 1
+        return None
+
+    async def __call__(self, request):
+        await request.aread()
+        event = self._find(request.method, self.sanitize_url(request.url))
+        if event is None:
+            return httpx.Response(200, json={"ok": True, "result": {}})
+        if self.speedup:
+            await asyncio.sleep(event.get("elapsed", 0) / self.speedup)
+        headers = {"content-type": event.get("content_type", "")}
+        if "json" in event:
+            return httpx.Response(event["status"], json=event["json"])
+        if "text" in event:
+            return httpx.Response(event["status"], text=event["text"], headers=headers)
+        if "base64" in event:
+            return httpx.Response(event["status"], content=base64.b64decode(event["base64"]), headers=headers)
+        if "placeholder" in event:
+            content_type = headers["content-type"]
+            if content_type not in self._clips:
+                self._clips[content_type] = await asyncio.to_thread(stock_clip, content_type)
+            return httpx.Response(event["status"], content=self._clips[content_type], headers=headers)
+        return httpx.Response(event["status"], headers=headers)
+
+
+async def replay(inbound, upstreams, speedup):
+    from app.http_client import http_client
+    from app.routes import app, shutdown, startup
+    from app.workers import work_queue
+
+    http_client.transport = httpx.MockTransport(upstreams)
+    await startup()
+    statuses = defaultdict(int)
+    started_at = time.monotonic()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay") as client:
+        first_t = inbound[0]["t"] if inbound else 0.0
+        for event in inbound:
+            if speedup:
+                delay = (event["t"] - first_t) / speedup - (time.monotonic() - started_at)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if event["channel"] == "telegram":
+                response = await client.post("/webhook", json=event["data"])
+            else:
+                response = await client.post("/webhook", data=event["data"])
+            statuses[response.json().get("status", response.status_code)] += 1
+        fed_at = time.monotonic()
+        await shutdown(drain_timeout=None)
+    finished_at = time.monotonic()
+    return {
+        "updates": len(inbound),
+        "webhook_statuses": dict(statuses),
+        "feed_seconds": fed_at - started_at,
+        "total_seconds": finished_at - started_at,
+        "updates_per_second": len(inbound) / (finished_at - started_at) if finished_at > started_at else 0.0,
+        "upstream_matched": upstreams.matched,
+        "upstream_approximate": upstreams.approximate,
+        "upstream_missing": sum(upstreams.missing.values()),
+        "work_queue": work_queue.stats(),
+    }
+
+
+def run_profiled(coroutine, profiler, output, top):
+    if profiler == "none":
+        return asyncio.run(coroutine)
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise RuntimeError("--profiler pyinstrument requires the 'pyinstrument' package")
+        sampler = Profiler(async_mode="enabled")
+        sampler.start()
+        try:
+            return asyncio.run(coroutine)
+        finally:
+            sampler.stop()
+            if output:
+                with open(output, "w") as f:
+                    f.write(sampler.output_html())
+            print(sampler.output_text(unicode=True, color=False))
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return asyncio.run(coroutine)
+    finally:
+        profile.disable()
+        if output:
+            profile.dump_stats(output)
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(top)
+        print(stream.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded webhook traffic offline.")
+    parser.add_argument("recording", help="JSONL written with RECORD_PATH")
+    parser.add_argument("--speedup", type=float, default=1.0,
+                        help="divide recorded gaps and upstream latencies by this (0: no waiting)")
+    parser.add_argument("--profiler", choices=["none", "cprofile", "pyinstrument"], default=None,
+                        help="default: cprofile when --profile is given, otherwise none")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="write cProfile stats (or pyinstrument HTML) to PATH")
+    parser.add_argument("--top", type=int, default=30, help="functions to list in the cProfile summary")
+    args = parser.parse_args()
+
+    # Never re-record the replay
+    os.environ["RECORD_PATH"] = ""
+    inbound, upstream = load(args.recording)
+    if not inbound:
+        sys.exit(f"{args.recording} has no inbound events")
+    # Build the app before profiling so import time does not show up in the profile
+    import app.routes  # noqa: F401
+
+    upstreams = RecordedUpstreams(upstream, args.speedup)
+    profiler = args.profiler or ("cprofile" if args.profile else "none")
+
+    report = run_profiled(replay(inbound, upstreams, args.speedup), profiler, args.profile, args.top)
+    print(json.dumps(report, indent=2))
+    for (method, url), count in sorted(upstreams.missing.items()):
+        print(f"not in recording: {method} {url} x{count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Load-test the webhook end to end against local stand-ins for every upstream.
+
+    python -m bench.run --messages 200 --concurrency 50 --morseverse-latency 0.2
+    python -m bench.run --save-baseline bench/baseline.json
+    python -m bench.run --baseline bench/baseline.json --max-regression 0.2
+
+Each synthetic message is timed from the webhook POST until the stand-in Telegram
+or Twilio API has received every reply for it (text, plus voice for voice messages).
+Memory columns are the RSS growth over the scenario, at the end and at its peak.
+With --baseline the run exits with status 1 when p95 latency or throughput of any
+scenario regresses by more than --max-regression.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+import httpx
+
+from .mock_upstreams import MockUpstreams
+
+SCENARIOS = {
+    "telegram_text": {"channel": "telegram", "kind": "text", "deliveries": 1},
+    "telegram_voice": {"channel": "telegram", "kind": "voice", "deliveries": 2},
+    "whatsapp_text": {"channel": "whatsapp", "kind": "text", "deliveries": 1},
+    "whatsapp_voice": {"channel": "whatsapp", "kind": "voice", "deliveries": 1},
+}
+
+
+class DeliveryTracker:
+    """Resolves a future once a destination has received the expected number of replies."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def expect(self, destination, count):
+        future = self.loop.create_future()
+        with self._lock:
+            self._pending[destination] = [count, future]
+        return future
+
+    def deliver(self, destination, kind):
+        # Called from the stand-in server thread
+        with self._lock:
+            pending = self._pending.get(destination)
+            if pending is None:
+                return
+            pending[0] -= 1
+            if pending[0] > 0:
+                return
+            del self._pending[destination]
+        self.loop.call_soon_threadsafe(_resolve, pending[1])
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(time.perf_counter())
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def sample_voice_ogg():
+    """Three seconds of OGG/Opus tone, or None when ffmpeg is not installed."""
+    if shutil.which("ffmpeg") is None:
+        return None
+    return subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "sine=frequency=300:duration=3",
+         "-c:a", "libopus", "-f", "ogg", "pipe:1"],
+        check=True, capture_output=True,
+    ).stdout
+
+
+def telegram_request(update_id, chat_id, kind, question):
+    message = {"message_id": update_id, "chat": {"id": chat_id}, "from": {"id": chat_id}}
+    if kind == "voice":
+        message["voice"] = {"file_id": f"file{update_id}", "duration": 3}
+    else:
+        message["text"] = question
+    return {"json": {"update_id": update_id, "message": message}}
+
+
+def whatsapp_request(message_sid, number, kind, question, media_base):
+    form = {"MessageSid": message_sid, "From": f"whatsapp:{number}", "To": "whatsapp:+15550000000"}
+    if kind == "voice":
+        form.update(Body="", NumMedia="1", MediaUrl0=f"{media_base}/twilio/media/{message_sid}.ogg",
+                    MediaContentType0="audio/ogg")
+    else:
+        form.update(Body=question, NumMedia="0")
+    return {"data": form}
+
+
+def current_rss_mb():
+    """Resident set size of this process right now (Linux /proc)."""
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+async def sample_peak_rss(peak, interval=0.05):
+    """Keep peak[0] at the highest RSS seen until cancelled."""
+    while True:
+        peak[0] = max(peak[0], current_rss_mb())
+        await asyncio.sleep(interval)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+async def run_scenario(client, tracker, ids, name, spec, args, media_base):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+
+    async def send_one(index):
+        nonlocal errors
+        n = next(ids)
+        question = f"Question {index % args.distinct_questions}"
+        if spec["channel"] == "telegram":
+            destination = str(n)
+            request = telegram_request(n, n, spec["kind"], question)
+        else:
+            destination = f"+1555{n:07d}"
+            request = whatsapp_request(f"SM{n:032d}", f"+1555{n:07d}", spec["kind"], question, media_base)
+        async with semaphore:
+            delivered = tracker.expect(destination, spec["deliveries"])
+            started_at = time.perf_counter()
+            response = await client.post("/webhook", **request)
+            if response.status_code != 200:
+                errors += 1
+                return
+            try:
+                finished_at = await asyncio.wait_for(delivered, args.timeout)
+            except asyncio.TimeoutError:
+                errors += 1
+                return
+            latencies.append(finished_at - started_at)
+
+    await asyncio.gather(*(send_one(i) for i in range(args.warmup)))
+    latencies.clear()
+    errors = 0
+
+    if args.trace_memory:
+        tracemalloc.start()
+    # RSS is measured against this scenario's own starting point, not the process peak
+    rss_before = current_rss_mb()
+    peak_rss = [rss_before]
+    sampler = asyncio.create_task(sample_peak_rss(peak_rss))
+    started_at = time.perf_counter()
+    await asyncio.gather(*(send_one(i) for i in range(args.messages)))
+    elapsed = time.perf_counter() - started_at
+    sampler.cancel()
+    rss_after = current_rss_mb()
+    result = {
+        "messages": args.messages,
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies, default=0.0),
+        "rss_growth_mb": rss_after - rss_before,
+        "peak_rss_growth_mb": max(peak_rss[0], rss_after) - rss_before,
+    }
+    if args.trace_memory:
+        result["python_peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    return result
+
+
+def compare(results, baseline, max_regression):
+    """Return a list of human-readable regressions against `baseline`."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["p95"] and result["p95"] > base["p95"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {result['p95'] * 1000:.1f}ms vs baseline {base['p95'] * 1000:.1f}ms")
+        if base["throughput"] and result["throughput"] < base["throughput"] * (1 - max_regression):
+            regressions.append(
+                f"{name}: throughput {result['throughput']:.1f}/s vs baseline {base['throughput']:.1f}/s")
+        if result["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: {result['errors']} errors vs baseline {base.get('errors', 0)}")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'scenario':<16}{'msgs':>6}{'err':>5}{'msg/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'+rss MB':>9}{'+peak MB':>9}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['messages']:>6}{r['errors']:>5}{r['throughput']:>9.1f}{r['p50'] * 1000:>9.1f}"
+              f"{r['p95'] * 1000:>9.1f}{r['p99'] * 1000:>9.1f}{r['rss_growth_mb']:>9.1f}"
+              f"{r['peak_rss_growth_mb']:>9.1f}")
+
+
+async def main(args):
+    voice_ogg = sample_voice_ogg()
+    tracker = DeliveryTracker(asyncio.get_running_loop())
+    mocks = MockUpstreams(
+        free_port(), voice_ogg or b"",
+        telegram_latency=args.telegram_latency, twilio_latency=args.twilio_latency,
+        morseverse_latency=args.morseverse_latency, tts_latency=args.tts_latency,
+        on_delivery=tracker.deliver,
+    )
+    mocks.start()
+
+    # The app reads its configuration at import time, so point it at the stand-ins first
+    os.environ.update(mocks.env())
+    os.environ.update({"TELEGRAM_BOT_TOKEN": "bench", "TWILIO_ACCOUNT_SID": "ACbench",
+                       "PREFERENCE_BACKEND": "memory", "TTS_CACHE_DIR": ""})
+    from app.routes import app, shutdown, startup
+
+    scenarios = args.scenario or list(SCENARIOS)
+    if voice_ogg is None:
+        skipped = [name for name in scenarios if SCENARIOS[name]["kind"] == "voice"]
+        if skipped:
+            print(f"ffmpeg not found, skipping {', '.join(skipped)}", file=sys.stderr)
+        scenarios = [name for name in scenarios if name not in skipped]
+
+    await startup()
+    results = {}
+    ids = itertools.count(1)
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in scenarios:
+                results[name] = await run_scenario(client, tracker, ids, name, SCENARIOS[name], args,
+                                                   mocks.base_url)
+    finally:
+        await shutdown()
+        mocks.stop()
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the webhook against local upstream stand-ins.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("--messages", type=int, default=200, help="messages per scenario")
+    parser.add_argument("--concurrency", type=int, default=50, help="messages in flight at once")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured messages before each scenario")
+    parser.add_argument("--distinct-questions", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for a reply")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="seconds")
+    parser.add_argument("--twilio-latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--morseverse-latency", type=float, default=0.3, help="seconds")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="seconds")
+    parser.add_argument("--trace-memory", action="store_true", help="report Python heap peak (slower)")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--baseline", metavar="PATH", help="fail on regressions against this baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed fraction, e.g. 0.2 = 20%%")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,22 @@
+# Multi-worker deployment under gunicorn (pip install gunicorn uvicorn-worker):
+#
+#     gunicorn -c gunicorn.conf.py main:app
+#
+# Workers are forked without preload_app, so every worker builds its own HTTP pool,
+# work queue and database connections; only the heavy third-party imports are loaded
+# once in the master and shared copy-on-write.
+from app.config import config
+from app.launcher import log_per_worker_state_warnings, preload_imports
+
+bind = f"0.0.0.0:{config.PORT}"
+workers = config.WEB_CONCURRENCY
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = False
+# Give each worker's lifespan time to drain its work queue after SIGTERM
+graceful_timeout = config.SHUTDOWN_DRAIN_TIMEOUT + 5
+
+
+def on_starting(server):
+    seconds = preload_imports()
+    server.log.info(f"Preloaded heavy imports in {seconds:.2f}s")
+    log_per_worker_state_warnings(workers)
@@ -1,6 +1,37 @@
-from app.routes import app
+import argparse
+
+from app.config import config
+
+
+def __getattr__(name):
+    # `main:app` is imported by every worker; the supervisor process never builds the app
+    if name == "app":
+        from app.routes import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Offline replay of captured traffic lives in bench/replay.py
+    parser = argparse.ArgumentParser(description="Run the Telegram/WhatsApp bot.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=config.PORT)
+    parser.add_argument("--polling", action="store_true",
+                        help="long-poll Telegram getUpdates instead of waiting for webhooks")
+    parser.add_argument("--workers", type=int, default=config.WEB_CONCURRENCY,
+                        help="server processes (default: WEB_CONCURRENCY)")
+    args = parser.parse_args()
+
+    from app.launcher import log_per_worker_state_warnings
+
+    if args.polling:
+        if args.workers > 1:
+            parser.error("--polling needs a single worker: getUpdates cannot be shared")
+        config.TELEGRAM_INGESTION = "polling"
+    log_per_worker_state_warnings(args.workers)
+    # On SIGTERM each worker stops accepting requests, then its lifespan drains the work
+    # queue for up to SHUTDOWN_DRAIN_TIMEOUT seconds before exiting
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers,
+                timeout_graceful_shutdown=config.SHUTDOWN_DRAIN_TIMEOUT)
@@ -0,0 +1,6 @@
+import os
+
+# Importing app modules builds their singletons; keep them off disk and the network
+os.environ.setdefault("PREFERENCE_BACKEND", "memory")
+os.environ.setdefault("DEDUP_BACKEND", "memory")
+os.environ.setdefault("RECORD_PATH", "")
@@ -0,0 +1,28 @@
+import pytest
+
+from app.answer_cache import AnswerCache
+
+
+@pytest.mark.parametrize("question", [
+    "How do I reset the app?",
+    "What is this?",
+    "Is it free?",
+    "Can I use it again tomorrow?",
+    "Come si installa?",
+])
+def test_generic_questions_are_cacheable(question):
+    assert AnswerCache(enabled=True).cacheable(question)
+
+
+@pytest.mark.parametrize("question", [
+    "How do I reset my password?",
+    "What did you say earlier?",
+    "Can you repeat that?",
+    "Qual è il mio saldo?",
+])
+def test_personal_or_follow_up_questions_bypass_the_cache(question):
+    assert not AnswerCache(enabled=True).cacheable(question)
+
+
+def test_disabled_cache_caches_nothing():
+    assert not AnswerCache(enabled=False).cacheable("What is this?")
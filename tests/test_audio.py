@@ -0,0 +1,29 @@
+import struct
+
+from app.audio import fix_wav_header
+
+
+def wav_with_placeholder_sizes(pcm, extra_chunk=b""):
+    """A WAV as ffmpeg writes it to a pipe: RIFF and data sizes left at 0xFFFFFFFF."""
+    fmt = struct.pack("<HHIIHH", 1, 1, 16000, 32000, 2, 16)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + extra_chunk
+    return b"RIFF" + b"\xff\xff\xff\xff" + body + b"data" + b"\xff\xff\xff\xff" + pcm
+
+
+def test_patches_riff_and_data_sizes():
+    wav = fix_wav_header(wav_with_placeholder_sizes(b"\x01\x00" * 100))
+    assert struct.unpack_from("<I", wav, 4)[0] == len(wav) - 8
+    data_offset = wav.index(b"data")
+    assert struct.unpack_from("<I", wav, data_offset + 4)[0] == 200
+
+
+def test_skips_chunks_before_data():
+    # A LIST chunk with an odd size is padded to an even boundary
+    extra = b"LIST" + struct.pack("<I", 3) + b"abc\x00"
+    wav = fix_wav_header(wav_with_placeholder_sizes(b"\x00" * 10, extra))
+    data_offset = wav.index(b"data")
+    assert struct.unpack_from("<I", wav, data_offset + 4)[0] == 10
+
+
+def test_leaves_non_wav_untouched():
+    assert fix_wav_header(b"OggS not a wav") == b"OggS not a wav"
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from app.dedup import MemoryDedupBackend
+
+
+def test_second_add_within_window_is_a_duplicate():
+    async def run():
+        backend = MemoryDedupBackend(max_entries=10)
+        return await backend.add("telegram:1", 60), await backend.add("telegram:1", 60)
+
+    assert asyncio.run(run()) == (True, False)
+
+
+def test_entries_expire_after_the_window():
+    async def run():
+        backend = MemoryDedupBackend(max_entries=10)
+        await backend.add("telegram:1", 0.05)
+        time.sleep(0.06)
+        return await backend.add("telegram:1", 60)
+
+    assert asyncio.run(run()) is True
+
+
+def test_oldest_entries_are_dropped_at_capacity():
+    async def run():
+        backend = MemoryDedupBackend(max_entries=3)
+        for key in ("a", "b", "c", "d"):
+            await backend.add(key, 60)
+        size = backend.size()
+        readded = await backend.add("a", 60)
+        return size, readded, backend.size()
+
+    size, readded, size_after = asyncio.run(run())
+    assert size == 3
+    assert readded is True
+    assert size_after == 3
+
+
+def test_discard_forgets_a_key():
+    async def run():
+        backend = MemoryDedupBackend(max_entries=10)
+        await backend.add("whatsapp:SM1", 60)
+        await backend.discard("whatsapp:SM1")
+        return await backend.add("whatsapp:SM1", 60)
+
+    assert asyncio.run(run()) is True
@@ -0,0 +1,26 @@
+import asyncio
+import base64
+import json
+
+from app.http_client import base64_json_body
+
+
+def collect(body):
+    async def read():
+        return b"".join([chunk async for chunk in body])
+    return asyncio.run(read())
+
+
+def test_body_is_json_with_base64_data():
+    data = bytes(range(256)) * 7
+    body, headers = base64_json_body({"companyId": "c", "lang": "EN-US"}, "wavData", data, chunk_size=100)
+    payload = json.loads(collect(body))
+    assert payload["companyId"] == "c"
+    assert base64.b64decode(payload["wavData"]) == data
+
+
+def test_content_length_matches_body():
+    for size in (0, 1, 2, 3, 4, 1000, 48 * 1024 + 1):
+        data = b"\xab" * size
+        body, headers = base64_json_body({"userId": "ü"}, "audioData", data, chunk_size=1000)
+        assert int(headers["Content-Length"]) == len(collect(body))
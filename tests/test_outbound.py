@@ -0,0 +1,55 @@
+import asyncio
+
+from app.outbound import TokenBucket, split_text
+
+
+def test_split_text_short_text_is_one_chunk():
+    assert split_text("hello", 10) == ["hello"]
+    assert split_text("", 10) == [""]
+
+
+def test_split_text_prefers_line_breaks_then_spaces():
+    assert split_text("first line\nsecond line", 15) == ["first line", "second line"]
+    assert split_text("aaa bbb ccc ddd", 8) == ["aaa bbb", "ccc ddd"]
+
+
+def test_split_text_keeps_links_whole():
+    link = "https://example.com/some/long/path"
+    chunks = split_text(f"Read more at {link} for details", 40)
+    assert any(link in chunk for chunk in chunks)
+    assert all(len(chunk) <= 40 for chunk in chunks)
+
+
+def test_split_text_cuts_words_longer_than_the_limit():
+    chunks = split_text("x" * 25, 10)
+    assert chunks == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_token_bucket_allows_burst_then_paces():
+    async def run():
+        bucket = TokenBucket(rate=20, burst=3)
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        for _ in range(3):
+            await bucket.acquire()
+        burst_elapsed = loop.time() - started_at
+        for _ in range(2):
+            await bucket.acquire()
+        return burst_elapsed, loop.time() - started_at
+
+    burst_elapsed, total_elapsed = asyncio.run(run())
+    assert burst_elapsed < 0.02
+    # Two more tokens at 20/s take about 0.1s
+    assert 0.08 <= total_elapsed < 0.3
+
+
+def test_token_bucket_pause_holds_callers_back():
+    async def run():
+        bucket = TokenBucket(rate=100, burst=10)
+        bucket.pause(0.1)
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        await bucket.acquire()
+        return loop.time() - started_at
+
+    assert asyncio.run(run()) >= 0.09
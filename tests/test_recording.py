@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from app.config import config
+from app.recording import pseudonym, sanitize, sanitize_url
+
+ACCOUNT_SID = "AC0123456789abcdef0123456789abcdef"
+
+# A Twilio Messages.json reply, as returned for a WhatsApp send
+TWILIO_MESSAGE = {
+    "account_sid": ACCOUNT_SID,
+    "api_version": "2010-04-01",
+    "body": "Your order 1234 ships tomorrow",
+    "date_created": "Thu, 30 Jul 2015 20:12:31 +0000",
+    "direction": "outbound-api",
+    "error_code": None,
+    "from": "whatsapp:+14155238886",
+    "messaging_service_sid": None,
+    "num_media": "0",
+    "num_segments": "1",
+    "price": None,
+    "sid": "SM1234567890abcdef1234567890abcdef",
+    "status": "queued",
+    "subresource_uris": {
+        "media": f"/2010-04-01/Accounts/{ACCOUNT_SID}/Messages/SM1234567890abcdef1234567890abcdef/Media.json",
+    },
+    "to": "whatsapp:+393331234567",
+    "uri": f"/2010-04-01/Accounts/{ACCOUNT_SID}/Messages/SM1234567890abcdef1234567890abcdef.json",
+}
+
+# A Morseverse textusermessage reply
+MORSEVERSE_ANSWER = {
+    "answer": "Hi Maria, your plan renews on 3 May.",
+    "voice_answer": "Hi Maria, your plan renews on the third of May.",
+    "links": ["https://example.com/faq/renewal"],
+}
+
+
+@pytest.fixture
+def redact_text(monkeypatch):
+    monkeypatch.setattr(config, "RECORD_REDACT_TEXT", True)
+
+
+def test_twilio_reply_keeps_no_account_sid_or_numbers(redact_text):
+    recorded = json.dumps(sanitize(TWILIO_MESSAGE))
+    assert ACCOUNT_SID not in recorded
+    assert "4155238886" not in recorded
+    assert "3331234567" not in recorded
+    assert "order 1234" not in recorded
+
+
+def test_twilio_reply_keeps_its_shape(redact_text):
+    sanitized = sanitize(TWILIO_MESSAGE)
+    assert "account_sid" not in sanitized
+    assert sanitized["uri"].startswith("/2010-04-01/Accounts/<sid>/Messages/")
+    assert sanitized["subresource_uris"]["media"].endswith("/Media.json")
+    assert sanitized["to"] == f"whatsapp:+{pseudonym('+393331234567')}"
+    assert sanitized["status"] == "queued"
+    assert len(sanitized["body"]) == len(TWILIO_MESSAGE["body"])
+
+
+def test_morseverse_answers_are_masked(redact_text):
+    recorded = json.dumps(sanitize(MORSEVERSE_ANSWER))
+    assert "Maria" not in recorded
+    assert "https://example.com/faq/renewal" in recorded
+
+
+def test_text_is_kept_without_redaction(monkeypatch):
+    monkeypatch.setattr(config, "RECORD_REDACT_TEXT", False)
+    assert sanitize(MORSEVERSE_ANSWER)["answer"] == MORSEVERSE_ANSWER["answer"]
+
+
+def test_telegram_update_ids_are_pseudonymized():
+    update = {"update_id": 1, "message": {"chat": {"id": 42, "first_name": "Ann"}, "from": {"id": 42}}}
+    sanitized = sanitize(update)
+    assert sanitized["message"]["chat"] == {"id": pseudonym(42)}
+    assert sanitized["message"]["from"]["id"] == pseudonym(42)
+    assert sanitized["update_id"] == 1
+
+
+def test_sanitize_url_drops_bot_token():
+    url = "https://api.telegram.org/bot123:ABC/sendMessage"
+    assert sanitize_url(url) == "https://api.telegram.org/bot<token>/sendMessage"
@@ -0,0 +1,166 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.resilience import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, ResilientClient, UpstreamFailure,
+)
+
+
+def respond(*statuses, delay=0.0):
+    """A `send` callable answering with `statuses` in turn (the last one repeats)."""
+    calls = []
+
+    async def send():
+        calls.append(len(calls))
+        if delay:
+            await asyncio.sleep(delay)
+        status = statuses[min(len(calls), len(statuses)) - 1]
+        if isinstance(status, Exception):
+            raise status
+        return httpx.Response(status, request=httpx.Request("POST", "http://upstream/"))
+
+    send.calls = calls
+    return send
+
+
+def client(**kwargs):
+    kwargs = {"deadline": 5.0, "retries": 2, "backoff": 0.001, "hedge_after": 0, **kwargs}
+    return ResilientClient("test", **kwargs)
+
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_half_open_allows_one_trial():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.opened_at -= 60
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_breaker_failed_trial_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    breaker.opened_at -= 60
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_release_frees_the_trial():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.opened_at -= 60
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_unexpected_error_in_trial_does_not_stick_half_open():
+    resilient = client()
+    resilient.breaker.state = OPEN
+    resilient.breaker.opened_at -= resilient.breaker.reset_timeout + 1
+
+    with pytest.raises(ValueError):
+        asyncio.run(resilient.call(respond(ValueError("bad body"))))
+    assert resilient.breaker.state == HALF_OPEN
+    asyncio.run(resilient.call(respond(200)))
+    assert resilient.breaker.state == CLOSED
+
+
+def test_idempotent_call_retries_5xx_until_success():
+    send = respond(503, 502, 200)
+    response = asyncio.run(client().call(send, idempotent=True))
+    assert response.status_code == 200
+    assert len(send.calls) == 3
+
+
+def test_non_idempotent_call_is_not_retried_after_reaching_server():
+    send = respond(503, 200)
+    with pytest.raises(UpstreamFailure):
+        asyncio.run(client().call(send, idempotent=False))
+    assert len(send.calls) == 1
+
+
+def test_connect_errors_are_retried_even_when_not_idempotent():
+    send = respond(httpx.ConnectError("refused"), 200)
+    response = asyncio.run(client().call(send, idempotent=False))
+    assert response.status_code == 200
+    assert len(send.calls) == 2
+
+
+def test_retries_give_up_and_count_one_breaker_failure():
+    resilient = client(retries=1)
+    send = respond(503)
+    with pytest.raises(UpstreamFailure):
+        asyncio.run(resilient.call(send, idempotent=True))
+    assert len(send.calls) == 2
+    assert resilient.breaker.failures == 1
+
+
+def test_4xx_is_returned_without_retry():
+    send = respond(404)
+    response = asyncio.run(client().call(send, idempotent=True))
+    assert response.status_code == 404
+    assert len(send.calls) == 1
+
+
+def test_deadline_bounds_the_whole_call():
+    send = respond(200, delay=1.0)
+
+    async def timed_call():
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        with pytest.raises(httpx.TimeoutException):
+            await client(deadline=0.1).call(send, idempotent=True)
+        return loop.time() - started_at
+
+    assert asyncio.run(timed_call()) < 0.5
+
+
+def test_hedge_returns_the_faster_response():
+    delays = [0.5, 0.0]
+
+    async def send():
+        await asyncio.sleep(delays.pop(0))
+        return httpx.Response(200, request=httpx.Request("POST", "http://upstream/"))
+
+    async def timed_call():
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        response = await client(hedge_after=0.05).call(send, idempotent=True, hedge=True)
+        return response, loop.time() - started_at
+
+    response, elapsed = asyncio.run(timed_call())
+    assert response.status_code == 200
+    assert elapsed < 0.3
+
+
+def test_non_idempotent_calls_are_never_hedged():
+    send = respond(200, delay=0.1)
+    asyncio.run(client(hedge_after=0.01).call(send, idempotent=False, hedge=True))
+    assert len(send.calls) == 1
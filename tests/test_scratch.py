@@ -0,0 +1,17 @@
+import os
+
+from app.scratch import remove_legacy_downloads
+
+
+def test_remove_legacy_downloads_removes_every_leftover_file(tmp_path):
+    for name in ("file_1.oga", "file_1.wav", "file_2.ogg", "MEabc123"):
+        (tmp_path / name).write_bytes(b"audio")
+    (tmp_path / "keep").mkdir()
+
+    assert remove_legacy_downloads(str(tmp_path)) == 4
+    assert os.listdir(tmp_path) == ["keep"]
+
+
+def test_remove_legacy_downloads_without_the_directory(tmp_path):
+    assert remove_legacy_downloads(str(tmp_path / "missing")) == 0
+    assert remove_legacy_downloads("") == 0